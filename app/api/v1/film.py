@@ -3,13 +3,19 @@ from http import HTTPStatus
 from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from pydantic import UUID4, BaseModel
 
+from core.responses import model_response
+from core.utils import NEXT_CURSOR_HEADER
+from db.base import InvalidCursorError
 from services.film import FilmService, get_film_service
 
 router = APIRouter()
 
+# Максимальное количество фильмов, запрашиваемых за раз
+FILM_BATCH_MAX_SIZE = 100
+
 
 class FilmOrderingEnum(enum.Enum):
     imdb_rating__asc = "imdb_rating"
@@ -46,21 +52,26 @@ class FilmListModel(BaseModel):
 @router.get("/{film_id:uuid}/", response_model=FilmDetailsModel)
 async def film_details(
     film_id: UUID, film_service: FilmService = Depends(get_film_service)
-) -> FilmDetailsModel:
+) -> Response:
     film = await film_service.get_by_id(film_id)
     if not film:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="film not found")
 
-    return FilmDetailsModel(
-        id=film.id,
-        title=film.title,
-        imdb_rating=film.imdb_rating,
-        description=film.description,
-        genres=film.genres,
-        actors=film.actors,
-        writers=film.writers,
-        directors=film.directors,
-    )
+    return model_response(FilmDetailsModel, film)
+
+
+@router.get("/batch/", response_model=List[FilmDetailsModel])
+async def film_batch(
+    ids: List[UUID] = Query(
+        ...,
+        max_items=FILM_BATCH_MAX_SIZE,
+        description="id фильмов, например из film_ids персоны. Ненайденные фильмы пропускаются",
+    ),
+    film_service: FilmService = Depends(get_film_service),
+) -> Response:
+    # Повторяющиеся id запрашиваются один раз, порядок сохраняется
+    films = await film_service.get_by_ids(dict.fromkeys(ids))
+    return model_response(List[FilmDetailsModel], films)
 
 
 @router.get("/", response_model=List[FilmListModel])
@@ -69,14 +80,35 @@ async def film_list(
     page_number: int = Query(default=1, ge=1, alias="page[number]"),
     page_size: int = Query(default=50, ge=1, alias="page[size]"),
     filter_genre_id: UUID = Query(None, alias="filter[genre]"),
+    page_cursor: Optional[str] = Query(
+        None,
+        alias="page[cursor]",
+        description="Пагинация по курсору: пустое значение для первой страницы, "
+        f"далее значение заголовка {NEXT_CURSOR_HEADER}",
+    ),
     film_service: FilmService = Depends(get_film_service),
-):
+) -> Response:
     sort_value, sort_order = sort.name.split("__")
 
     filter_map = {}
     if filter_genre_id:
         filter_map["genre_id"] = filter_genre_id
 
+    if page_cursor is not None:
+        try:
+            films_list, next_cursor = await film_service.get_cursor_page(
+                filter_map=filter_map,
+                cursor=page_cursor,
+                page_size=page_size,
+                sort_value=sort_value,
+                sort_order=sort_order,
+            )
+        except InvalidCursorError:
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="invalid cursor")
+
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        return model_response(List[FilmListModel], films_list, headers=headers)
+
     films_list = await film_service.get_page(
         filter_map=filter_map,
         page_number=page_number,
@@ -84,7 +116,7 @@ async def film_list(
         sort_value=sort_value,
         sort_order=sort_order,
     )
-    return films_list
+    return model_response(List[FilmListModel], films_list)
 
 
 @router.get("/search/", response_model=List[FilmListModel])
@@ -93,6 +125,6 @@ async def film_search(
     size: Optional[int] = 50,
     query: Optional[str] = "",
     film_service: FilmService = Depends(get_film_service),
-) -> List[FilmListModel]:
+) -> Response:
     films = await film_service.search(page=page, size=size, match_obj=query)
-    return [FilmListModel(**film) for film in films]
+    return model_response(List[FilmListModel], films)
@@ -4,9 +4,12 @@ from http import HTTPStatus
 from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from pydantic import UUID4, BaseModel
 
+from core.responses import model_response
+from core.utils import NEXT_CURSOR_HEADER
+from db.base import InvalidCursorError
 from services.genre import GenreService, get_genre_service
 
 router = APIRouter()
@@ -31,11 +34,11 @@ class SortFields(Enum):
 @router.get("/{genre_id:uuid}/", response_model=Genre)
 async def genre_details(
     genre_id: UUID, genre_service: GenreService = Depends(get_genre_service)
-) -> Genre:
+) -> Response:
     genre = await genre_service.get_by_id(genre_id)
     if not genre:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="genre not found")
-    return Genre(id=genre.id, name=genre.name)
+    return model_response(Genre, genre)
 
 
 @router.get("/", response_model=List[Genre])
@@ -43,10 +46,27 @@ async def genre_list(
     page: Optional[int] = 1,
     size: Optional[int] = 50,
     sort: Optional[SortFields] = SortFields.name__asc,
+    cursor: Optional[str] = Query(
+        None,
+        description="Пагинация по курсору: пустое значение для первой страницы, "
+        f"далее значение заголовка {NEXT_CURSOR_HEADER}",
+    ),
     genre_service: GenreService = Depends(get_genre_service),
-) -> List[Genre]:
+) -> Response:
     sort_value, sort_order = sort.name.split("__")
+
+    if cursor is not None:
+        try:
+            genres, next_cursor = await genre_service.get_genres_cursor_page(
+                cursor=cursor, size=size, sort_value=sort_value, sort_order=sort_order
+            )
+        except InvalidCursorError:
+            raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail="invalid cursor")
+
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        return model_response(List[Genre], genres, headers=headers)
+
     genres = await genre_service.get_genres_list(
         page=page, size=size, sort_value=sort_value, sort_order=sort_order
     )
-    return [Genre(id=genre.id, name=genre.name) for genre in genres]
+    return model_response(List[Genre], genres)
@@ -3,9 +3,10 @@ from http import HTTPStatus
 from typing import List, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from pydantic import UUID4, BaseModel
 
+from core.responses import model_response
 from services.person import PersonService, get_person_service
 
 router = APIRouter()
@@ -40,19 +41,19 @@ class PersonFilm(BaseModel):
 @router.get("/{person_id:uuid}/", response_model=Person)
 async def person_details(
     person_id: UUID, person_service: PersonService = Depends(get_person_service)
-) -> Person:
+) -> Response:
     person, person_roles, film_ids = await person_service.get_by_id(person_id)
     if not person:
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail="person not found")
-    return Person(id=person.id, full_name=person.full_name, roles=person_roles, film_ids=film_ids)
+    return model_response(Person, {**person, "roles": person_roles, "film_ids": film_ids})
 
 
 @router.get("/{person_id:uuid}/film/", response_model=List[PersonFilm])
 async def person_film_list(
     person_id: UUID, person_service: PersonService = Depends(get_person_service)
-) -> List[PersonFilm]:
+) -> Response:
     films = await person_service.get_person_film_list(person_id)
-    return [PersonFilm(**film) for film in films]
+    return model_response(List[PersonFilm], films)
 
 
 @router.get("/search/", response_model=List[Person])
@@ -61,14 +62,12 @@ async def person_search(
     size: Optional[int] = 50,
     query: Optional[str] = "",
     person_service: PersonService = Depends(get_person_service),
-) -> List[Person]:
+) -> Response:
     persons_full_data = await person_service.search_person_by_full_name(
         page=page, size=size, match_obj=query
     )
-    persons = []
-    for person_full_data in persons_full_data:
-        person, person_roles, film_ids = person_full_data
-        persons.append(
-            Person(id=person.id, full_name=person.full_name, roles=person_roles, film_ids=film_ids)
-        )
-    return persons
+    persons = [
+        {**person, "roles": person_roles, "film_ids": film_ids}
+        for person, person_roles, film_ids in persons_full_data
+    ]
+    return model_response(List[Person], persons)
@@ -12,8 +12,50 @@ PROJECT_NAME = os.getenv("PROJECT_NAME", "movies")
 # Настройки Redis
 REDIS_DSN = os.getenv("REDIS_DSN", "redis://localhost:6379/0")
 
+# Время, в течение которого ответ в кеше считается свежим
+CACHE_EXPIRE_IN_SECONDS = int(os.getenv("CACHE_EXPIRE_IN_SECONDS", 60))
+# Время после устаревания, в течение которого ответ отдается из кеша, пока обновляется в фоне
+CACHE_STALE_IN_SECONDS = int(os.getenv("CACHE_STALE_IN_SECONDS", 5 * 60))
+# Относительный разброс времени жизни ключей, чтобы они не устаревали одновременно
+CACHE_EXPIRE_JITTER = float(os.getenv("CACHE_EXPIRE_JITTER", 0.1))
+
+# Хешировать ключи кеша вместо хранения пути и параметров запроса в открытом виде
+CACHE_KEY_HASHED = os.getenv("CACHE_KEY_HASHED", "false").lower() in ("1", "true", "yes")
+
+# Тела ответов от этого размера в байтах хранятся в кеше сжатыми gzip
+CACHE_COMPRESS_MIN_SIZE = int(os.getenv("CACHE_COMPRESS_MIN_SIZE", 1024))
+CACHE_COMPRESS_LEVEL = int(os.getenv("CACHE_COMPRESS_LEVEL", 6))
+
+# Локальный кеш в памяти воркера перед redis: максимальный размер в байтах и время жизни ключей
+CACHE_LOCAL_MAX_SIZE = int(os.getenv("CACHE_LOCAL_MAX_SIZE", 64 * 1024 * 1024))
+CACHE_LOCAL_EXPIRE_IN_SECONDS = int(
+    os.getenv("CACHE_LOCAL_EXPIRE_IN_SECONDS", CACHE_EXPIRE_IN_SECONDS)
+)
+
+# Канал redis, в который etl публикует события об изменении документов для сброса кеша
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+
+# Проверять ответы api по их моделям. Это единственная проверка документов хранилища:
+# без нее документы отдаются как есть
+VALIDATE_RESPONSES = os.getenv("VALIDATE_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+# Разрешить клиентам запрашивать разбивку времени ответа заголовком X-Server-Timing
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+# Разрешить профилирование запросов заголовком X-Profile или параметром ?profile. Только для отладки
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+# Каталог для файлов профилей. Если не задан, отчет профилировщика отдается вместо ответа
+PROFILING_DIR = os.getenv("PROFILING_DIR", "")
+
 # Настройки Elasticsearch
 ELASTIC_DSN = os.getenv("ELASTIC_DSN", "http://localhost:9200/")
 
 # Корень проекта
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Хранилище документов: elastic или memory - документы в памяти процесса без elastic
+DB_STORAGE_ELASTIC = "elastic"
+DB_STORAGE_MEMORY = "memory"
+DB_STORAGE = os.getenv("DB_STORAGE", DB_STORAGE_ELASTIC)
+# Каталог с файлами genres.json, persons.json и movies.json для хранилища в памяти
+MEMORY_STORAGE_PATH = os.getenv("MEMORY_STORAGE_PATH", os.path.join(BASE_DIR, "data"))
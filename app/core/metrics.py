@@ -0,0 +1,61 @@
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from starlette.requests import Request
+from starlette.responses import Response
+
+# Путь, по которому prometheus забирает метрики
+METRICS_PATH = "/metrics"
+
+# Ответы из кеша занимают доли миллисекунды, поэтому нижние корзины мельче стандартных
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+REQUEST_DURATION = Histogram(
+    "api_request_duration_seconds",
+    "Время обработки запроса api",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# result: hit - свежий ответ из кеша, stale - устаревший ответ из кеша, miss - ответ вычислен,
+# bypass - запрос не кешируется
+CACHE_REQUESTS = Counter(
+    "api_cache_requests_total", "Запросы через кеш ответов по результату", ["result"]
+)
+
+# Обращения к уровням кеша: tier - local (память процесса) или remote (redis), result - hit/miss
+CACHE_TIER_REQUESTS = Counter(
+    "api_cache_tier_requests_total", "Обращения к уровням кеша по результату", ["tier", "result"]
+)
+
+ELASTIC_REQUEST_DURATION = Histogram(
+    "api_elastic_request_duration_seconds",
+    "Время запросов к elasticsearch",
+    ["index", "method"],
+    buckets=LATENCY_BUCKETS,
+)
+
+REDIS_REQUEST_DURATION = Histogram(
+    "api_redis_request_duration_seconds",
+    "Время запросов к redis",
+    ["method"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+async def metrics(request: Request) -> Response:
+    """Метрики процесса в текстовом формате prometheus"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,645 @@
+import asyncio
+import cProfile
+import gzip
+import hashlib
+import logging
+import pstats
+import re
+import time
+from http import HTTPStatus
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Set, Tuple
+
+from starlette.routing import BaseRoute, Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core import config
+from core.metrics import CACHE_REQUESTS, METRICS_PATH, REQUEST_DURATION
+from core.profiling import (
+    PROFILE_SCOPE_KEY,
+    format_profile,
+    get_profile_filename,
+    is_profiled,
+    profile_requested,
+    write_profile,
+)
+from core.route_params import get_canonical_query
+from core.timing import (
+    SERVER_TIMING_REQUEST_HEADER,
+    format_server_timing,
+    server_timings,
+    timing,
+)
+from core.utils import jitter
+from db.base import AbstractCacheStorage
+
+logger = logging.getLogger(__name__)
+
+# Пути, ответы на которые не кешируются
+NOT_CACHED_PATHS = ("/api/openapi", "/api/openapi.json", METRICS_PATH)
+
+UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+
+GZIP = b"gzip"
+
+# Клиенты и прокси хранят ответ, но перед использованием проверяют его по ETag
+CACHE_CONTROL = b"no-cache"
+# Префикс ключа, под которым рядом с ответом хранится его ETag
+ETAG_KEY_PREFIX = b"etag:"
+
+# Время жизни блокировки на вычисление ответа между воркерами
+CACHE_LOCK_EXPIRE_IN_SECONDS = 5
+# Интервал проверки кеша, пока ответ вычисляет другой воркер
+CACHE_LOCK_POLL_INTERVAL = 0.05
+
+
+class CachedResponse:
+    """
+    Ответ, сохраняемый в кеше: статус, заголовки и тело хранятся вместе.
+    Формат похож на http: первая строка со статусом, временем, до которого ответ свежий,
+    и кодировкой тела, затем заголовки и пустая строка, затем тело.
+    Большие тела хранятся сжатыми gzip и отдаются клиентам, которые его принимают, без распаковки.
+    Клиенту, у которого уже есть эта версия ответа (совпал If-None-Match), отдается 304 без тела.
+    """
+
+    def __init__(
+        self,
+        status: int,
+        headers: List[Tuple[bytes, bytes]],
+        body: bytes,
+        fresh_until: float = 0,
+        encoding: bytes = b"",
+    ):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.fresh_until = fresh_until
+        self.encoding = encoding
+
+    @property
+    def is_stale(self) -> bool:
+        return time.time() >= self.fresh_until
+
+    @property
+    def etag(self) -> Optional[bytes]:
+        for name, value in self.headers:
+            if name.lower() == b"etag":
+                return value
+        return None
+
+    def compress(self) -> None:
+        """Сжимает тело, если оно достаточно большое и еще не сжато приложением"""
+        if self.encoding or len(self.body) < config.CACHE_COMPRESS_MIN_SIZE:
+            return
+        if any(name.lower() == b"content-encoding" for name, _ in self.headers):
+            return
+
+        self.body = gzip.compress(self.body, compresslevel=config.CACHE_COMPRESS_LEVEL, mtime=0)
+        self.encoding = GZIP
+
+    def pack(self) -> bytes:
+        head = [b"%d %d %s" % (self.status, self.fresh_until, self.encoding)]
+        head += [name + b": " + value for name, value in self.headers]
+        return b"\r\n".join(head) + b"\r\n\r\n" + self.body
+
+    @classmethod
+    def unpack(cls, data: bytes) -> "CachedResponse":
+        head, body = data.split(b"\r\n\r\n", 1)
+        status_line, *header_lines = head.split(b"\r\n")
+        status, fresh_until, encoding = (status_line.split(b" ") + [b"", b""])[:3]
+        headers = [(name, value) for name, value in (line.split(b": ", 1) for line in header_lines)]
+        return cls(
+            status=int(status),
+            headers=headers,
+            body=body,
+            fresh_until=int(fresh_until or 0),
+            encoding=encoding,
+        )
+
+    async def send(self, scope: Scope, send: Send) -> None:
+        etag = self.etag
+        if etag is not None and etag_matches(scope, etag):
+            await send_not_modified(send, etag)
+            return
+
+        headers, body = self.headers, self.body
+        if self.encoding == GZIP:
+            headers = [
+                (name, value) for name, value in headers if name.lower() != b"content-length"
+            ]
+            headers.append((b"vary", b"Accept-Encoding"))
+            if accepts_gzip(scope):
+                headers.append((b"content-encoding", GZIP))
+            else:
+                body = gzip.decompress(body)
+            headers.append((b"content-length", b"%d" % len(body)))
+
+        await send({"type": "http.response.start", "status": self.status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+def accepts_gzip(scope: Scope) -> bool:
+    """Проверяет, принимает ли клиент тело ответа, сжатое gzip"""
+    for name, value in scope.get("headers", []):
+        if name != b"accept-encoding":
+            continue
+        for coding in value.lower().split(b","):
+            coding_name, _, params = coding.strip().partition(b";")
+            if coding_name.strip() in (GZIP, b"*") and params.replace(b" ", b"") not in (
+                b"q=0",
+                b"q=0.0",
+            ):
+                return True
+    return False
+
+
+def get_etag(body: bytes) -> bytes:
+    """
+    Слабый ETag по содержимому несжатого тела.
+    Слабый, так как одна и та же версия ответа может отдаваться как сжатой, так и несжатой.
+    """
+    return b'W/"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest().encode()
+
+
+def get_etag_key(key: bytes) -> bytes:
+    return ETAG_KEY_PREFIX + key
+
+
+def etag_matches(scope: Scope, etag: bytes) -> bool:
+    """Проверяет, есть ли etag среди перечисленных клиентом в If-None-Match"""
+    for name, value in scope.get("headers", []):
+        if name != b"if-none-match":
+            continue
+        for candidate in value.split(b","):
+            candidate = candidate.strip()
+            # If-None-Match сравнивается без учета признака слабого ETag
+            if candidate == b"*" or candidate.replace(b"W/", b"", 1) == etag.replace(b"W/", b"", 1):
+                return True
+    return False
+
+
+async def send_not_modified(send: Send, etag: bytes) -> None:
+    headers = [(b"etag", etag), (b"cache-control", CACHE_CONTROL)]
+    await send(
+        {"type": "http.response.start", "status": HTTPStatus.NOT_MODIFIED, "headers": headers}
+    )
+    await send({"type": "http.response.body", "body": b""})
+
+
+def match_route(routes: Sequence[BaseRoute], scope: Scope) -> Optional[BaseRoute]:
+    """Маршрут, которым будет обработан запрос"""
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+
+class CacheMiddleware:
+    """
+    ASGI middleware для кеширования GET-запросов.
+    При промахе тело ответа отдается клиенту по мере готовности и параллельно копируется в кеш,
+    при попадании ответ отдается из кеша как есть, без разбора json.
+    Одновременные промахи по одному ключу объединяются: ответ вычисляется один раз в воркере,
+    а между воркерами вычисление разделяется короткой блокировкой в хранилище кеша.
+    Устаревший ответ отдается сразу, а обновляется в фоне (stale-while-revalidate).
+
+    Успешные ответы отдаются с ETag по содержимому тела. ETag хранится под отдельным ключом,
+    поэтому на условный запрос с совпавшим If-None-Match ответ 304 отдается без чтения тела из кеша.
+
+    Ключ кеша строится из пути и провалидированных query-параметров обработчика:
+    параметры отсортированы, значения по умолчанию подставлены, неизвестные параметры отброшены,
+    поэтому эквивалентные запросы используют одну запись.
+    Запросы, для которых не нашелся обработчик или параметры не прошли валидацию, не кешируются.
+
+    Каждый сохраненный ответ привязывается к тегам для сброса по событиям etl:
+    ответы по конкретной сущности - к id всех сущностей в пути и теле ответа,
+    списки и поиск - к тегам индексов из path_tags по префиксу пути.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        cache_storage: AbstractCacheStorage,
+        routes: Sequence[BaseRoute],
+        path_tags: Optional[Mapping[str, Iterable[str]]] = None,
+    ):
+        self.app = app
+        self.cache_storage = cache_storage
+        self.routes = routes
+        self.path_tags = path_tags or {}
+        # Ответы, которые вычисляются в данный момент, по ключу кеша
+        self.inflight: Dict[bytes, asyncio.Future] = {}
+        # Ссылки на фоновые обновления, чтобы задачи не были собраны сборщиком мусора
+        self.background_tasks: Set[asyncio.Task] = set()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        key = None
+        # Профилируемый запрос должен дойти до обработчика и не попасть в кеш
+        if (
+            scope["method"] == "GET"
+            and scope["path"] not in NOT_CACHED_PATHS
+            and not is_profiled(scope)
+        ):
+            key = self.get_key(scope)
+        if key is None:
+            CACHE_REQUESTS.labels(result="bypass").inc()
+            await self.app(scope, receive, send)
+            return
+
+        if await self.check_not_modified(key, scope, send):
+            return
+
+        cached_response = await self.get_cached_response(key)
+        if cached_response is not None:
+            if cached_response.is_stale:
+                CACHE_REQUESTS.labels(result="stale").inc()
+                self.schedule_revalidate(key, scope)
+            else:
+                CACHE_REQUESTS.labels(result="hit").inc()
+            await cached_response.send(scope, send)
+            return
+
+        CACHE_REQUESTS.labels(result="miss").inc()
+
+        # Ответ по этому ключу уже вычисляется: ждем его вместо повторного запроса к базе
+        inflight = self.inflight.get(key)
+        if inflight is not None:
+            cached_response = await asyncio.shield(inflight)
+            if cached_response is not None:
+                await cached_response.send(scope, send)
+            else:
+                await self.app(scope, receive, send)
+            return
+
+        inflight = asyncio.get_running_loop().create_future()
+        self.inflight[key] = inflight
+        response = None
+        try:
+            response = await self.fill(key, scope, receive, send)
+        finally:
+            self.inflight.pop(key, None)
+            inflight.set_result(response)
+
+    def get_key(self, scope: Scope) -> Optional[bytes]:
+        """Канонический ключ кеша для запроса, либо None, если запрос не кешируется"""
+        route = match_route(self.routes, scope)
+        if route is None:
+            return None
+
+        query = get_canonical_query(route, scope.get("query_string", b""))
+        if query is None:
+            return None
+
+        key = f"{scope['path']}?{query}" if query else scope["path"]
+        if config.CACHE_KEY_HASHED:
+            return b"cache:" + hashlib.blake2b(key.encode(), digest_size=16).hexdigest().encode()
+        return key.encode()
+
+    async def check_not_modified(self, key: bytes, scope: Scope, send: Send) -> bool:
+        """
+        Отвечает 304, если ETag закешированного ответа есть в If-None-Match запроса.
+        Читается только ETag, тело ответа из кеша не запрашивается.
+        """
+        if not any(name == b"if-none-match" for name, _ in scope.get("headers", [])):
+            return False
+
+        with timing("cache", "etag lookup"):
+            data_in_cache = await self.cache_storage.get(key=get_etag_key(key))
+        if not data_in_cache:
+            return False
+
+        fresh_until, etag = data_in_cache.split(b" ", 1)
+        if not etag_matches(scope, etag):
+            return False
+
+        if time.time() >= int(fresh_until):
+            CACHE_REQUESTS.labels(result="stale").inc()
+            self.schedule_revalidate(key, scope)
+        else:
+            CACHE_REQUESTS.labels(result="hit").inc()
+        await send_not_modified(send, etag)
+        return True
+
+    def schedule_revalidate(self, key: bytes, scope: Scope) -> None:
+        if key in self.inflight:
+            return
+
+        task = asyncio.create_task(self.revalidate(key, dict(scope)))
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def get_cached_response(self, key: bytes) -> Optional[CachedResponse]:
+        with timing("cache", "lookup"):
+            data_in_cache = await self.cache_storage.get(key=key)
+        if not data_in_cache:
+            return None
+
+        return CachedResponse.unpack(data_in_cache)
+
+    async def fill(
+        self, key: bytes, scope: Scope, receive: Receive, send: Send
+    ) -> Optional[CachedResponse]:
+        """
+        Вычисляет ответ и сохраняет его в кеш.
+        Если ответ по этому ключу уже вычисляет другой воркер, сначала ждем его появления в кеше.
+        Если блокировка снята, а ответа в кеше нет (например, 404 не кешируется),
+        ответ сразу вычисляется в этом воркере.
+        """
+        lock_token = await self.cache_storage.acquire_lock(key, expire=CACHE_LOCK_EXPIRE_IN_SECONDS)
+        if lock_token is None:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + CACHE_LOCK_EXPIRE_IN_SECONDS
+            while lock_token is None and loop.time() < deadline:
+                await asyncio.sleep(CACHE_LOCK_POLL_INTERVAL)
+                cached_response = await self.get_cached_response(key)
+                if cached_response is not None:
+                    await cached_response.send(scope, send)
+                    return cached_response
+                lock_token = await self.cache_storage.acquire_lock(
+                    key, expire=CACHE_LOCK_EXPIRE_IN_SECONDS
+                )
+
+        try:
+            return await self.compute(key, scope, receive, send)
+        finally:
+            if lock_token is not None:
+                await self.cache_storage.release_lock(key, token=lock_token)
+
+    async def revalidate(self, key: bytes, scope: Scope) -> None:
+        """
+        Фоновое обновление устаревшего ответа.
+        Если обновление уже идет в этом или другом воркере, ничего не делаем.
+        """
+
+        async def receive() -> Message:
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message: Message) -> None:
+            pass
+
+        inflight = asyncio.get_running_loop().create_future()
+        self.inflight[key] = inflight
+        response = None
+        try:
+            lock_token = await self.cache_storage.acquire_lock(
+                key, expire=CACHE_LOCK_EXPIRE_IN_SECONDS
+            )
+            if lock_token is not None:
+                try:
+                    response = await self.compute(key, scope, receive, send)
+                finally:
+                    await self.cache_storage.release_lock(key, token=lock_token)
+        except Exception:
+            logger.exception("Failed to revalidate cached response for %r", key)
+        finally:
+            self.inflight.pop(key, None)
+            inflight.set_result(response)
+
+    async def compute(
+        self, key: bytes, scope: Scope, receive: Receive, send: Send
+    ) -> Optional[CachedResponse]:
+        """Вызывает приложение и сохраняет успешный ответ в кеш"""
+        response = await self.call_and_collect(scope, receive, send)
+        if response is None or response.status != HTTPStatus.OK:
+            return None
+
+        tags = self.get_tags(scope["path"], response)
+        response.fresh_until = time.time() + jitter(
+            config.CACHE_EXPIRE_IN_SECONDS, config.CACHE_EXPIRE_JITTER
+        )
+        response.compress()
+        await self.cache_storage.set(key=key, value=response.pack())
+
+        keys = [key]
+        etag = response.etag
+        if etag is not None:
+            etag_key = get_etag_key(key)
+            await self.cache_storage.set(
+                key=etag_key, value=b"%d %s" % (response.fresh_until, etag)
+            )
+            keys.append(etag_key)
+
+        if tags:
+            for tagged_key in keys:
+                await self.cache_storage.tag(key=tagged_key, tags=tags)
+        return response
+
+    def get_tags(self, path: str, response: CachedResponse) -> Set[str]:
+        """Теги, при сбросе которых ответ становится неактуальным"""
+        path_ids = UUID_RE.findall(path)
+        if path_ids:
+            return {*path_ids, *UUID_RE.findall(response.body.decode())}
+
+        for prefix, tags in self.path_tags.items():
+            if path.startswith(prefix):
+                return set(tags)
+        return set()
+
+    async def call_and_collect(
+        self, scope: Scope, receive: Receive, send: Send
+    ) -> Optional[CachedResponse]:
+        """
+        Вызывает приложение, отправляя ответ клиенту и одновременно собирая его копию.
+        Заголовки отправляются вместе с первой частью тела: если успешный ответ пришел целиком,
+        к ним добавляется ETag, а при совпадении с If-None-Match клиенту уходит 304 без тела.
+        Возвращает None, если ответ не был отправлен полностью.
+        """
+        start_message: Optional[Message] = None
+        body: List[bytes] = []
+        complete = False
+        not_modified = False
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal start_message, complete, not_modified
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            if message["type"] == "http.response.body":
+                if not body and start_message is not None:
+                    if start_message["status"] == HTTPStatus.OK and not message.get("more_body"):
+                        etag = get_etag(message.get("body", b""))
+                        start_message = {
+                            **start_message,
+                            "headers": [
+                                *start_message.get("headers", []),
+                                (b"etag", etag),
+                                (b"cache-control", CACHE_CONTROL),
+                            ],
+                        }
+                        if etag_matches(scope, etag):
+                            not_modified = True
+                            await send_not_modified(send, etag)
+                    if not not_modified:
+                        await send(start_message)
+                body.append(message.get("body", b""))
+                complete = not message.get("more_body", False)
+
+            if not not_modified:
+                await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+        if start_message is None or not complete:
+            return None
+
+        return CachedResponse(
+            status=start_message["status"],
+            headers=list(start_message.get("headers", [])),
+            body=b"".join(body),
+        )
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware для метрик времени обработки запросов.
+    Запросы группируются по шаблону пути маршрута, а не по самому пути,
+    чтобы id в пути не порождали отдельные серии метрик.
+    """
+
+    def __init__(self, app: ASGIApp, routes: Sequence[BaseRoute]):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = match_route(self.routes, scope)
+        route_path = getattr(route, "path", "unmatched")
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_DURATION.labels(
+                method=scope["method"], route=route_path, status=int(status)
+            ).observe(time.perf_counter() - start)
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware, добавляющее к ответу заголовок Server-Timing с разбивкой времени:
+    поиск в кеше, каждый запрос к elastic, проверка и сериализация ответа, общее время.
+    Включается настройкой SERVER_TIMING_ENABLED и заголовком запроса X-Server-Timing,
+    поэтому остальные запросы не тратят время на замеры.
+    Должно быть внешним по отношению к CacheMiddleware, чтобы заголовок не попадал в кеш.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not config.SERVER_TIMING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        if not any(name == SERVER_TIMING_REQUEST_HEADER for name, _ in scope.get("headers", [])):
+            await self.app(scope, receive, send)
+            return
+
+        timings: List[Tuple[str, str, float]] = []
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                total = time.perf_counter() - start
+                headers = [
+                    *message.get("headers", []),
+                    (b"server-timing", format_server_timing(timings, total)),
+                ]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = server_timings.set(timings)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            server_timings.reset(token)
+
+
+class ProfilerMiddleware:
+    """
+    Отладочное ASGI middleware: профилирует cProfile запросы с заголовком X-Profile
+    или параметром ?profile. Включается настройкой PROFILING_ENABLED.
+    Если задан PROFILING_DIR, профиль сохраняется в нем в формате pstats, а имя файла
+    отдается в заголовке X-Profile-File; иначе вместо ответа отдается текстовый отчет.
+
+    Профилируемые запросы идут мимо кеша и выполняются по одному, так как в потоке может
+    работать только один профилировщик. Профиль включает и другие задачи event loop,
+    выполнявшиеся в это время, но не синхронные зависимости, выполняемые в пуле потоков.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.lock = asyncio.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not config.PROFILING_ENABLED or not profile_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        scope = {**scope, PROFILE_SCOPE_KEY: True}
+        if config.PROFILING_DIR:
+            await self.profile_to_file(scope, receive, send)
+        else:
+            await self.profile_inline(scope, receive, send)
+
+    async def profile(self, scope: Scope, receive: Receive, send: Send) -> pstats.Stats:
+        profiler = cProfile.Profile()
+        async with self.lock:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                profiler.disable()
+        return pstats.Stats(profiler)
+
+    async def profile_to_file(self, scope: Scope, receive: Receive, send: Send) -> None:
+        filename = get_profile_filename(scope)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = [*message.get("headers", []), (b"x-profile-file", filename.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+
+        stats = await self.profile(scope, receive, send_wrapper)
+        path = write_profile(stats, config.PROFILING_DIR, filename)
+        logger.info("Profile of %s %s saved to %s", scope["method"], scope["path"], path)
+
+    async def profile_inline(self, scope: Scope, receive: Receive, send: Send) -> None:
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+
+        async def send_wrapper(message: Message) -> None:
+            # Ответ обработчика не отдается, вместо него отдается отчет
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        stats = await self.profile(scope, receive, send_wrapper)
+        report = f"{scope['method']} {scope['path']} -> {int(status)}\n\n{format_profile(stats)}"
+        body = report.encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": HTTPStatus.OK,
+                "headers": [
+                    (b"content-type", b"text/plain; charset=utf-8"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
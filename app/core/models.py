@@ -1,3 +1,5 @@
+from typing import List, Type
+
 import pydantic
 
 from core import json
@@ -8,3 +10,15 @@ class BaseModel(pydantic.BaseModel):
         # Заменяем стандартную работу с json на более быструю
         json_loads = json.loads
         json_dumps = json.dumps
+
+
+def get_model_fields(model: Type[pydantic.BaseModel], prefix: str = "") -> List[str]:
+    """Поля модели для выборки из хранилища, поля вложенных моделей - через точку"""
+    fields = []
+    for field in model.__fields__.values():
+        name = f"{prefix}{field.alias}"
+        if isinstance(field.type_, type) and issubclass(field.type_, pydantic.BaseModel):
+            fields.extend(get_model_fields(field.type_, prefix=f"{name}."))
+        else:
+            fields.append(name)
+    return fields
@@ -0,0 +1,54 @@
+import io
+import os
+import pstats
+import re
+import time
+
+from starlette.datastructures import QueryParams
+from starlette.types import Scope
+
+# Заголовок и query-параметр, которыми клиент включает профилирование запроса
+PROFILE_REQUEST_HEADER = b"x-profile"
+PROFILE_QUERY_PARAM = "profile"
+# Ключ scope, которым профилируемый запрос помечается для остальных middleware
+PROFILE_SCOPE_KEY = "profile"
+
+# Количество функций в текстовом отчете
+PROFILE_REPORT_LIMIT = 50
+
+UNSAFE_FILENAME_RE = re.compile(r"[^\w.-]+")
+
+
+def profile_requested(scope: Scope) -> bool:
+    """Запросил ли клиент профилирование заголовком X-Profile или параметром ?profile"""
+    if any(name == PROFILE_REQUEST_HEADER for name, _ in scope.get("headers", [])):
+        return True
+    return PROFILE_QUERY_PARAM in QueryParams(scope.get("query_string", b""))
+
+
+def is_profiled(scope: Scope) -> bool:
+    return bool(scope.get(PROFILE_SCOPE_KEY))
+
+
+def get_profile_filename(scope: Scope) -> str:
+    """Имя файла профиля: время запроса, метод и путь"""
+    path = UNSAFE_FILENAME_RE.sub("_", scope["path"]).strip("_") or "root"
+    # Наносекунды различают профили запросов, пришедших в одну секунду
+    timestamp = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 10**9:09d}"
+    return f"{timestamp}-{scope['method']}-{path}.prof"
+
+
+def write_profile(stats: pstats.Stats, directory: str, filename: str) -> str:
+    """Сохраняет профиль в формате pstats, его можно открыть snakeviz или pstats"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, filename)
+    stats.dump_stats(path)
+    return path
+
+
+def format_profile(stats: pstats.Stats, limit: int = PROFILE_REPORT_LIMIT) -> str:
+    """Текстовый отчет pstats: самые дорогие функции по суммарному времени с вложенными вызовами"""
+    stream = io.StringIO()
+    report = pstats.Stats(stream=stream).add(stats)
+    report.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+    return stream.getvalue()
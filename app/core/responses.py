@@ -0,0 +1,39 @@
+import logging
+from typing import Any, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse
+from pydantic import ValidationError, parse_obj_as
+
+from core import config
+from core.timing import timing
+
+logger = logging.getLogger(__name__)
+
+
+def model_response(
+    response_model: Any, content: Any, headers: Optional[Dict[str, str]] = None
+) -> ORJSONResponse:
+    """
+    Ответ из документов хранилища, сериализуемых orjson за один проход.
+    Нужные модели ответа поля отобраны запросом к хранилищу, а модель ответа
+    используется для документации и по умолчанию не проверяется.
+    Документы хранилища не проверяются и при загрузке etl, поэтому без VALIDATE_RESPONSES
+    ошибки в данных (например, null в обязательном поле) доходят до клиентов как есть.
+    С VALIDATE_RESPONSES содержимое проверяется по модели ответа, а расхождения логируются:
+    невалидное содержимое отдается как есть.
+    """
+    if config.VALIDATE_RESPONSES:
+        try:
+            with timing("validate"):
+                validated = jsonable_encoder(parse_obj_as(response_model, content))
+        except ValidationError:
+            # Ответ отдается как есть: проверка нужна, чтобы найти расхождения, а не ломать api
+            logger.exception("Response content is not valid %s", response_model)
+        else:
+            if validated != content:
+                logger.warning("Response content does not match %s", response_model)
+            content = validated
+
+    with timing("serialize"):
+        return ORJSONResponse(content, headers=headers or {})
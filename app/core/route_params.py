@@ -0,0 +1,91 @@
+"""
+Канонические query-параметры обработчика FastAPI для ключа кеша.
+
+Единственное место, которое знает, как FastAPI хранит параметры обработчика.
+Используются только атрибуты, общие для полей FastAPI на pydantic 1 и 2: dependant маршрута
+с query_params и dependencies, alias, default, field_info и validate поля,
+а различия версий собраны в is_required и is_sequence_field,
+поэтому кеш не привязывает приложение к версии FastAPI.
+"""
+
+from collections.abc import Sequence, Set
+from enum import Enum
+from typing import Any, Dict, Optional, Union, get_args, get_origin
+from urllib.parse import urlencode
+
+from starlette.datastructures import QueryParams
+from starlette.routing import BaseRoute
+
+
+def get_canonical_query(route: BaseRoute, query_string: bytes) -> Optional[str]:
+    """
+    Query-параметры обработчика маршрута в каноническом виде: отсортированы,
+    значения по умолчанию подставлены, неизвестные параметры отброшены.
+    Возвращает None, если маршрут обслуживается не FastAPI или параметры не прошли валидацию.
+    """
+    dependant = getattr(route, "dependant", None)
+    if dependant is None:
+        return None
+
+    query_params = QueryParams(query_string)
+    params = []
+    for field in get_query_fields(dependant).values():
+        if is_sequence_field(field):
+            value = query_params.getlist(field.alias) or None
+        else:
+            value = query_params.get(field.alias)
+
+        if value is None:
+            if is_required(field):
+                return None
+            value = field.default
+        else:
+            value, errors = field.validate(value, {}, loc=("query", field.alias))
+            if errors:
+                return None
+
+        if value is not None:
+            params.append((field.alias, get_canonical_value(value)))
+    return urlencode(sorted(params), doseq=True)
+
+
+def get_query_fields(dependant: Any) -> Dict[str, Any]:
+    """Query-параметры обработчика и всех его зависимостей по имени параметра"""
+    fields = {field.alias: field for field in dependant.query_params}
+    for sub_dependant in dependant.dependencies:
+        for alias, field in get_query_fields(sub_dependant).items():
+            fields.setdefault(alias, field)
+    return fields
+
+
+def is_required(field: Any) -> bool:
+    # pydantic 1 хранит признак в поле, pydantic 2 - в field_info
+    required = getattr(field, "required", None)
+    return field.field_info.is_required() if required is None else bool(required)
+
+
+def is_sequence_field(field: Any) -> bool:
+    """Принимает ли параметр несколько значений: ?ids=1&ids=2"""
+    # pydantic 2 хранит аннотацию в field_info, pydantic 1 - в outer_type_
+    annotation = getattr(field.field_info, "annotation", None) or field.outer_type_
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        annotation = args[0] if len(args) == 1 else None
+    # Ограничения вроде max_items pydantic 1 превращает в подкласс list без параметров типа
+    origin = get_origin(annotation) or annotation
+    return (
+        isinstance(origin, type)
+        and issubclass(origin, (Sequence, Set))
+        and not issubclass(origin, (str, bytes))
+    )
+
+
+def get_canonical_value(value: Any) -> Any:
+    """Приводит провалидированное значение параметра к строке для ключа кеша"""
+    if isinstance(value, (list, tuple, set)):
+        return [get_canonical_value(v) for v in value]
+    if isinstance(value, Enum):
+        return get_canonical_value(value.value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
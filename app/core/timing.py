@@ -0,0 +1,47 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Заголовок запроса, которым клиент включает разбивку времени ответа в заголовке Server-Timing
+SERVER_TIMING_REQUEST_HEADER = b"x-server-timing"
+
+# Замеры текущего запроса: название, описание и время в секундах.
+# None - разбивка для запроса не включена, замеры не собираются
+server_timings: ContextVar[Optional[List[Tuple[str, str, float]]]] = ContextVar(
+    "server_timings", default=None
+)
+
+
+@contextmanager
+def timing(name: str, description: str = "") -> Iterator[None]:
+    """Замеряет время блока для заголовка Server-Timing, если разбивка включена для запроса"""
+    timings = server_timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((name, description, time.perf_counter() - start))
+
+
+def format_server_timing(timings: List[Tuple[str, str, float]], total: float) -> bytes:
+    """
+    Значение заголовка Server-Timing. Повторяющиеся названия нумеруются,
+    чтобы каждый вызов, например каждый запрос к elastic, был виден отдельно
+    """
+    metrics: List[str] = []
+    counts: Dict[str, int] = {}
+    for name, description, duration in timings:
+        counts[name] = counts.get(name, 0) + 1
+        if counts[name] > 1:
+            name = f"{name}-{counts[name]}"
+        metric = f"{name};dur={duration * 1000:.2f}"
+        if description:
+            metric += f';desc="{description}"'
+        metrics.append(metric)
+    metrics.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(metrics).encode()
@@ -1,13 +1,9 @@
-class async_iterator_wrapper:
-    def __init__(self, obj):
-        self._it = iter(obj)
+import random
 
-    def __aiter__(self):
-        return self
+# Заголовок ответа с курсором следующей страницы при пагинации по курсору
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
 
-    async def __anext__(self):
-        try:
-            value = next(self._it)
-        except StopIteration:
-            raise StopAsyncIteration
-        return value
+
+def jitter(value: float, spread: float) -> float:
+    """Случайно изменяет value в пределах доли spread в обе стороны"""
+    return value * random.uniform(1 - spread, 1 + spread)
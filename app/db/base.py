@@ -1,39 +1,117 @@
+import asyncio
+import base64
+import binascii
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Iterable, Optional
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from core import json
+
+# Ключи кеша: middleware строит их в байтах
+CacheKey = Union[str, bytes]
 
 DEFAULT_LIMIT = 50
 
 
+class InvalidCursorError(ValueError):
+    """Курсор пагинации не удалось разобрать"""
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Упаковывает значения сортировки последнего документа в непрозрачный курсор"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Распаковывает курсор, полученный из encode_cursor"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError) as e:
+        raise InvalidCursorError(cursor) from e
+
+    if not isinstance(values, list):
+        raise InvalidCursorError(cursor)
+    return values
+
+
 class AbstractCacheStorage(ABC):
     """
     Абстрактный класс для взаимодействия с хранилищем для кеширования
     """
 
     @abstractmethod
-    async def get(self, key: str) -> Any:
+    async def get(self, key: CacheKey) -> Any:
+        pass
+
+    @abstractmethod
+    async def set(self, key: CacheKey, value: bytes, expire: Optional[int] = None) -> None:
+        pass
+
+    async def get_with_tags(self, key: CacheKey) -> Tuple[Any, Set[str]]:
+        """Значение по ключу вместе с тегами, к которым привязан ключ"""
+        return await self.get(key=key), set()
+
+    @abstractmethod
+    async def acquire_lock(self, key: CacheKey, expire: float) -> Optional[str]:
+        """
+        Захват короткой блокировки по ключу.
+        Возвращает токен владельца блокировки или None, если блокировка уже занята
+        """
+        pass
+
+    @abstractmethod
+    async def release_lock(self, key: CacheKey, token: str) -> None:
+        """
+        Снятие блокировки, только если ее держит владелец токена: блокировка могла истечь
+        и достаться другому воркеру, пока владелец вычислял ответ
+        """
+        pass
+
+    @abstractmethod
+    async def tag(self, key: CacheKey, tags: Iterable[str], expire: Optional[int] = None) -> None:
+        """Привязка ключа к тегам (id сущностей, индексам), по которым его можно сбросить"""
         pass
 
     @abstractmethod
-    async def set(self, key: str, value: str, expire: Optional[int] = None) -> None:
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        """Удаление всех ключей, привязанных к тегам"""
         pass
 
 
 class AbstractDBStorage(ABC):
+    """
+    Абстрактный класс для взаимодействия с хранилищем документов.
+    Методы получения документов принимают fields - список полей, которые нужно вернуть
+    (вложенные поля через точку), по умолчанию документы возвращаются целиком.
+    """
+
     @abstractmethod
-    async def get(self, id: Any) -> Optional[Dict]:
+    async def get(self, id: Any, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
         pass
 
     @abstractmethod
     async def filter(
         self,
         filter_map: Optional[dict] = None,
+        search_map: Optional[dict] = None,
         order_map: Optional[dict] = None,
         offset: int = 0,
         limit: int = DEFAULT_LIMIT,
+        fields: Optional[Iterable[str]] = None,
         **kwargs
     ) -> Iterable[Dict]:
         pass
 
+    async def get_many(
+        self, ids: Iterable[Any], fields: Optional[Iterable[str]] = None
+    ) -> List[Dict]:
+        """
+        Получение документов по списку id в порядке их перечисления, ненайденные пропускаются.
+        Базовая реализация запрашивает документы параллельно по одному, хранилища могут
+        переопределить метод более эффективным способом.
+        """
+        docs = await asyncio.gather(*(self.get(id=id, fields=fields) for id in ids))
+        return [doc for doc in docs if doc is not None]
+
     async def page(
         self,
         filter_map: Optional[dict] = None,
@@ -49,3 +127,74 @@ class AbstractDBStorage(ABC):
             limit=page_size,
             **kwargs
         )
+
+    async def cursor_page(
+        self,
+        filter_map: Optional[dict] = None,
+        search_map: Optional[dict] = None,
+        order_map: Optional[dict] = None,
+        cursor: Optional[str] = None,
+        page_size: int = DEFAULT_LIMIT,
+        fields: Optional[Iterable[str]] = None,
+        **kwargs
+    ) -> Tuple[Iterable[Dict], Optional[str]]:
+        """
+        Получение страницы по курсору. Возвращает документы и курсор следующей страницы,
+        либо None, если страница последняя.
+        Базовая реализация хранит в курсоре смещение, хранилища могут
+        переопределить метод более эффективным способом.
+        """
+        offset = 0
+        if cursor:
+            values = decode_cursor(cursor)
+            if len(values) != 1 or not isinstance(values[0], int) or values[0] < 0:
+                raise InvalidCursorError(cursor)
+            offset = values[0]
+
+        items = list(
+            await self.filter(
+                filter_map=filter_map,
+                search_map=search_map,
+                order_map=order_map,
+                offset=offset,
+                limit=page_size,
+                fields=fields,
+                **kwargs
+            )
+        )
+        next_cursor = encode_cursor([offset + len(items)]) if len(items) == page_size else None
+        return items, next_cursor
+
+    async def iterate(
+        self,
+        filter_map: Optional[dict] = None,
+        search_map: Optional[dict] = None,
+        order_map: Optional[dict] = None,
+        chunk_size: int = DEFAULT_LIMIT,
+        fields: Optional[Iterable[str]] = None,
+        **kwargs
+    ) -> AsyncIterator[Dict]:
+        """
+        Потоковое получение всех документов, подходящих под фильтр, пачками по chunk_size.
+        Базовая реализация использует постраничный filter, хранилища могут
+        переопределить метод более эффективным способом.
+        """
+        offset = 0
+        while True:
+            items = list(
+                await self.filter(
+                    filter_map=filter_map,
+                    search_map=search_map,
+                    order_map=order_map,
+                    offset=offset,
+                    limit=chunk_size,
+                    fields=fields,
+                    **kwargs
+                )
+            )
+            for item in items:
+                yield item
+
+            if len(items) < chunk_size:
+                return
+            offset += len(items)
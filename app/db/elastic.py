@@ -1,10 +1,22 @@
+from contextlib import contextmanager
 from functools import lru_cache
-from typing import Dict, Iterable, Optional
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from elasticsearch import AsyncElasticsearch, NotFoundError
+from elasticsearch import AsyncElasticsearch, NotFoundError, RequestError
 from fastapi import Depends
 
-from db.base import DEFAULT_LIMIT, AbstractDBStorage
+from core.metrics import ELASTIC_REQUEST_DURATION
+from core.timing import timing
+from db.base import (
+    DEFAULT_LIMIT,
+    AbstractDBStorage,
+    InvalidCursorError,
+    decode_cursor,
+    encode_cursor,
+)
+
+# Время жизни point in time между запросами пачек при потоковом чтении
+PIT_KEEP_ALIVE = "1m"
 
 es: AsyncElasticsearch = None
 
@@ -18,14 +30,33 @@ class ElasticStorage(AbstractDBStorage):
         self.elastic = elastic
         self.index_name = index_name
 
-    async def get(self, id: str) -> Optional[Dict]:
+    async def get(self, id: str, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
         try:
-            doc = await self.elastic.get(index=self.index_name, id=id)
+            with self.observe("get"):
+                doc = await self.elastic.get(
+                    index=self.index_name, id=id, _source_includes=self.get_source_includes(fields)
+                )
         except NotFoundError:
             return None
 
         return doc["_source"]
 
+    async def get_many(
+        self, ids: Iterable[str], fields: Optional[Iterable[str]] = None
+    ) -> List[Dict]:
+        """Получение документов по списку id одним запросом _mget"""
+        ids = [str(id) for id in ids]
+        if not ids:
+            return []
+
+        with self.observe("mget"):
+            docs = await self.elastic.mget(
+                index=self.index_name,
+                body={"ids": ids},
+                _source_includes=self.get_source_includes(fields),
+            )
+        return [doc["_source"] for doc in docs["docs"] if doc.get("found")]
+
     async def filter(
         self,
         filter_map: Optional[dict] = None,
@@ -33,24 +64,179 @@ class ElasticStorage(AbstractDBStorage):
         order_map: Optional[dict] = None,
         offset: int = 0,
         limit: int = DEFAULT_LIMIT,
+        fields: Optional[Iterable[str]] = None,
+        search_after: Optional[List[Any]] = None,
         **kwargs,
     ) -> Iterable[Dict]:
-        filter_map = filter_map or {}
-        search_map = search_map or {}
+        hits = await self.search_hits(
+            filter_map=filter_map,
+            search_map=search_map,
+            order_map=order_map,
+            offset=offset,
+            limit=limit,
+            search_after=search_after,
+            fields=fields,
+        )
+        return [hit["_source"] for hit in hits]
+
+    async def cursor_page(
+        self,
+        filter_map: Optional[dict] = None,
+        search_map: Optional[dict] = None,
+        order_map: Optional[dict] = None,
+        cursor: Optional[str] = None,
+        page_size: int = DEFAULT_LIMIT,
+        fields: Optional[Iterable[str]] = None,
+        **kwargs,
+    ) -> Tuple[Iterable[Dict], Optional[str]]:
+        """
+        Получение страницы по курсору через search_after.
+        Курсор хранит значения сортировки последнего документа страницы,
+        поэтому стоимость любой страницы такая же, как у первой.
+        """
+        order_map = {**(order_map or {})}
+        # id нужен как однозначный tiebreaker для search_after
+        order_map.setdefault("id", "asc")
+
+        search_after = decode_cursor(cursor) if cursor else None
+        if search_after is not None and len(search_after) != len(order_map):
+            raise InvalidCursorError(cursor)
+
+        try:
+            hits = await self.search_hits(
+                filter_map=filter_map,
+                search_map=search_map,
+                order_map=order_map,
+                limit=page_size,
+                search_after=search_after,
+                fields=fields,
+            )
+        except RequestError as e:
+            # Значения курсора не подходят к типам полей сортировки
+            if search_after is None:
+                raise
+            raise InvalidCursorError(cursor) from e
+        next_cursor = encode_cursor(hits[-1]["sort"]) if len(hits) == page_size else None
+        return [hit["_source"] for hit in hits], next_cursor
+
+    async def search_hits(
+        self,
+        filter_map: Optional[dict] = None,
+        search_map: Optional[dict] = None,
+        order_map: Optional[dict] = None,
+        offset: int = 0,
+        limit: int = DEFAULT_LIMIT,
+        search_after: Optional[List[Any]] = None,
+        fields: Optional[Iterable[str]] = None,
+    ) -> List[Dict]:
         order_map = order_map or {}
 
+        body = self.get_body(filter_map or {}, search_map or {})
+        if search_after is not None:
+            body["search_after"] = search_after
+            offset = 0
+
+        with self.observe("search"):
+            docs = await self.elastic.search(
+                index=self.index_name,
+                sort=[f"{field}:{direction}" for field, direction in order_map.items()],
+                from_=offset,
+                size=limit,
+                body=body,
+                _source_includes=self.get_source_includes(fields),
+            )
+        return docs["hits"]["hits"]
+
+    async def iterate(
+        self,
+        filter_map: Optional[dict] = None,
+        search_map: Optional[dict] = None,
+        order_map: Optional[dict] = None,
+        chunk_size: int = DEFAULT_LIMIT,
+        fields: Optional[Iterable[str]] = None,
+        **kwargs,
+    ) -> AsyncIterator[Dict]:
+        """
+        Потоковое получение всех документов.
+        Первая пачка запрашивается обычным поиском: чаще всего документов меньше одной пачки,
+        и тогда хватает одного запроса к elastic.
+        Если пачка полная, документы читаются через point in time и search_after:
+        стоимость каждой следующей пачки не растет, а следующие пачки видят один снимок индекса.
+        Чтение из снимка продолжается после последнего документа первой пачки:
+        сортировка заканчивается уникальным id, поэтому его значений сортировки достаточно.
+        """
+        order_map = {**(order_map or {})}
+        # id нужен как однозначный tiebreaker для search_after
+        order_map.setdefault("id", "asc")
+
+        hits = await self.search_hits(
+            filter_map=filter_map,
+            search_map=search_map,
+            order_map=order_map,
+            limit=chunk_size,
+            fields=fields,
+        )
+        for hit in hits:
+            yield hit["_source"]
+        if len(hits) < chunk_size:
+            return
+
+        body = self.get_body(filter_map or {}, search_map or {})
+        body["size"] = chunk_size
+        body["sort"] = self.get_sort(order_map)
+        body["search_after"] = hits[-1]["sort"]
+        async for hit in self.iterate_pit(body, fields):
+            yield hit["_source"]
+
+    async def iterate_pit(
+        self, body: Dict, fields: Optional[Iterable[str]] = None
+    ) -> AsyncIterator[Dict]:
+        """Все найденные документы из point in time пачками по body["size"]"""
+        with self.observe("open_pit"):
+            pit = await self.elastic.open_point_in_time(
+                index=self.index_name, keep_alive=PIT_KEEP_ALIVE
+            )
+        pit_id = pit["id"]
+        try:
+            while True:
+                body["pit"] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+                with self.observe("search_pit"):
+                    docs = await self.elastic.search(
+                        body=body, _source_includes=self.get_source_includes(fields)
+                    )
+                hits = docs["hits"]["hits"]
+                for hit in hits:
+                    yield hit
+
+                if len(hits) < body["size"]:
+                    return
+                pit_id = docs.get("pit_id", pit_id)
+                body["search_after"] = hits[-1]["sort"]
+        finally:
+            with self.observe("close_pit"):
+                await self.elastic.close_point_in_time(body={"id": pit_id})
+
+    @contextmanager
+    def observe(self, method: str) -> Iterator[None]:
+        """Замер запроса к elastic для метрик и заголовка Server-Timing"""
+        with ELASTIC_REQUEST_DURATION.labels(index=self.index_name, method=method).time():
+            with timing("es", f"{self.index_name} {method}"):
+                yield
+
+    def get_body(self, filter_map: Dict, search_map: Dict) -> Dict:
         body = {}
         if filter_map or search_map:
             body["query"] = self.get_query(filter_map, search_map)
+        return body
 
-        docs = await self.elastic.search(
-            index=self.index_name,
-            sort=[f"{field}:{direction}" for field, direction in order_map.items()],
-            from_=offset,
-            size=limit,
-            body=body,
-        )
-        return [doc["_source"] for doc in docs["hits"]["hits"]]
+    @staticmethod
+    def get_source_includes(fields: Optional[Iterable[str]]) -> Optional[List[str]]:
+        """Поля документа для _source_includes, None - документ целиком"""
+        return list(fields) if fields is not None else None
+
+    @staticmethod
+    def get_sort(order_map: Dict) -> List[Dict]:
+        return [{field: {"order": direction}} for field, direction in order_map.items()]
 
     def get_query(self, filter_map: Dict, search_map: Dict) -> Dict:
         query = {}
@@ -81,6 +267,22 @@ class ElasticFilmStorage(ElasticStorage):
                     "query": {"term": {f"{path}.id": str(filter_map[key])}},
                 }
 
+        # Фильмы, в которых любая из персон участвовала в любой роли
+        if "person_ids" in filter_map:
+            person_ids = [str(person_id) for person_id in filter_map["person_ids"]]
+            query["bool"] = {
+                "should": [
+                    {
+                        "nested": {
+                            "path": f"{role}s",
+                            "query": {"terms": {f"{role}s.id": person_ids}},
+                        }
+                    }
+                    for role in ["actor", "director", "writer"]
+                ],
+                "minimum_should_match": 1,
+            }
+
         return query
 
 
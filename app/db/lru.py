@@ -0,0 +1,162 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+from uuid import uuid4
+
+from core import config
+from core.metrics import CACHE_TIER_REQUESTS
+from db.base import AbstractCacheStorage, CacheKey
+
+
+class LRUCacheStorage(AbstractCacheStorage):
+    """
+    Хранилище кеша в памяти процесса.
+    Ограничено суммарным размером значений, при переполнении вытесняются давно неиспользуемые ключи.
+    """
+
+    def __init__(self, max_size: int, expire: int):
+        self.max_size = max_size
+        self.expire = expire
+        self.size = 0
+        # key -> (время истечения, значение, размер)
+        self.items: "OrderedDict[Any, Tuple[float, Any, int]]" = OrderedDict()
+        # key -> (время истечения, токен владельца)
+        self.locks: Dict[Any, Tuple[float, str]] = {}
+        # Теги по ключам и ключи по тегам для сброса кеша
+        self.key_tags: Dict[Any, Set[str]] = {}
+        self.tag_keys: Dict[str, Set[Any]] = {}
+
+    async def get(self, key: CacheKey) -> Any:
+        item = self.items.get(key)
+        if item is None:
+            return None
+
+        expires_at, value, _ = item
+        if expires_at <= time.monotonic():
+            self.delete(key)
+            return None
+
+        self.items.move_to_end(key)
+        return value
+
+    async def get_with_tags(self, key: CacheKey) -> Tuple[Any, Set[str]]:
+        value = await self.get(key=key)
+        return value, set(self.key_tags.get(key, ())) if value is not None else set()
+
+    async def set(self, key: CacheKey, value: Any, expire: Optional[int] = None) -> None:
+        if expire is None:
+            expire = self.expire
+
+        self.delete(key)
+        size = len(value)
+        if size > self.max_size:
+            return
+
+        while self.size + size > self.max_size:
+            self.delete(next(iter(self.items)))
+
+        self.items[key] = (time.monotonic() + expire, value, size)
+        self.size += size
+
+    def delete(self, key: CacheKey) -> None:
+        item = self.items.pop(key, None)
+        if item is not None:
+            self.size -= item[2]
+
+        for tag in self.key_tags.pop(key, ()):
+            keys = self.tag_keys.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tag_keys[tag]
+
+    async def acquire_lock(self, key: CacheKey, expire: float) -> Optional[str]:
+        now = time.monotonic()
+        lock = self.locks.get(key)
+        if lock is not None and lock[0] > now:
+            return None
+
+        token = uuid4().hex
+        self.locks[key] = (now + expire, token)
+        return token
+
+    async def release_lock(self, key: CacheKey, token: str) -> None:
+        lock = self.locks.get(key)
+        if lock is not None and lock[1] == token:
+            del self.locks[key]
+
+    async def tag(self, key: CacheKey, tags: Iterable[str], expire: Optional[int] = None) -> None:
+        if key not in self.items:
+            return
+
+        for tag in tags:
+            self.key_tags.setdefault(key, set()).add(tag)
+            self.tag_keys.setdefault(tag, set()).add(key)
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        keys: Set[Any] = set()
+        for tag in tags:
+            keys.update(self.tag_keys.get(tag, ()))
+
+        for key in keys:
+            self.delete(key)
+
+
+class TieredCacheStorage(AbstractCacheStorage):
+    """
+    Двухуровневый кеш: локальный кеш в памяти процесса перед общим хранилищем (redis).
+    Значения, найденные в общем хранилище, поднимаются в локальный кеш вместе с тегами,
+    поэтому локальный кеш сбрасывается по тем же тегам, что и общий.
+    Блокировки берутся в общем хранилище, чтобы работать между воркерами.
+    """
+
+    def __init__(self, local: LRUCacheStorage, remote: AbstractCacheStorage):
+        self.local = local
+        self.remote = remote
+
+    async def get(self, key: CacheKey) -> Any:
+        value = await self.local.get(key=key)
+        if value is not None:
+            CACHE_TIER_REQUESTS.labels(tier="local", result="hit").inc()
+            return value
+        CACHE_TIER_REQUESTS.labels(tier="local", result="miss").inc()
+
+        value, tags = await self.remote.get_with_tags(key=key)
+        if value is None:
+            CACHE_TIER_REQUESTS.labels(tier="remote", result="miss").inc()
+            return None
+
+        CACHE_TIER_REQUESTS.labels(tier="remote", result="hit").inc()
+        await self.local.set(key=key, value=value)
+        if tags:
+            await self.local.tag(key=key, tags=tags)
+        return value
+
+    async def set(self, key: CacheKey, value: Any, expire: Optional[int] = None) -> None:
+        local_expire = self.local.expire if expire is None else min(expire, self.local.expire)
+        await self.local.set(key=key, value=value, expire=local_expire)
+        await self.remote.set(key=key, value=value, expire=expire)
+
+    async def acquire_lock(self, key: CacheKey, expire: float) -> Optional[str]:
+        return await self.remote.acquire_lock(key=key, expire=expire)
+
+    async def release_lock(self, key: CacheKey, token: str) -> None:
+        await self.remote.release_lock(key=key, token=token)
+
+    async def tag(self, key: CacheKey, tags: Iterable[str], expire: Optional[int] = None) -> None:
+        tags = list(tags)
+        await self.local.tag(key=key, tags=tags, expire=expire)
+        await self.remote.tag(key=key, tags=tags, expire=expire)
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        # Локальный кеш сбрасывается в каждом воркере по своему индексу тегов,
+        # так как общий индекс в redis удаляет первый обработавший событие воркер
+        tags = list(tags)
+        await self.local.invalidate(tags=tags)
+        await self.remote.invalidate(tags=tags)
+
+
+def get_local_cache_storage() -> LRUCacheStorage:
+    return LRUCacheStorage(
+        max_size=config.CACHE_LOCAL_MAX_SIZE, expire=config.CACHE_LOCAL_EXPIRE_IN_SECONDS
+    )
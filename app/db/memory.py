@@ -0,0 +1,264 @@
+import json
+import math
+import os
+import re
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from db.base import DEFAULT_LIMIT, AbstractDBStorage
+
+WORD_RE = re.compile(r"\w+")
+
+ROLES = ["actor", "director", "writer"]
+
+# Настройки индексов: поля с заранее посчитанной сортировкой, поля полнотекстового поиска
+# и фильтры - ключ filter_map и списки вложенных документов, по id которых он фильтрует
+INDEXES: Dict[str, Dict[str, Any]] = {
+    "genres": {"sort_fields": ["id", "name"], "search_fields": ["name"], "filters": {}},
+    "persons": {"sort_fields": ["id", "full_name"], "search_fields": ["full_name"], "filters": {}},
+    "movies": {
+        "sort_fields": ["id", "imdb_rating", "title"],
+        "search_fields": ["title"],
+        "filters": {
+            "genre_id": ["genres"],
+            **{f"{role}_id": [f"{role}s"] for role in ROLES},
+            # Фильмы, в которых любая из персон участвовала в любой роли
+            "person_ids": [f"{role}s" for role in ROLES],
+        },
+    },
+}
+
+storages: Dict[str, "MemoryStorage"] = {}
+
+
+def project(doc: Dict, fields: Optional[Iterable[str]]) -> Dict:
+    """Оставляет в документе только поля fields, вложенные поля - через точку"""
+    if fields is None:
+        return dict(doc)
+
+    nested = defaultdict(list)
+    result = {}
+    for field in fields:
+        name, _, rest = field.partition(".")
+        if rest:
+            nested[name].append(rest)
+        elif name in doc:
+            result[name] = doc[name]
+
+    for name, nested_fields in nested.items():
+        value = doc.get(name)
+        if isinstance(value, list):
+            result[name] = [project(item, nested_fields) for item in value]
+        elif isinstance(value, dict):
+            result[name] = project(value, nested_fields)
+    return result
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return WORD_RE.findall(text.lower()) if text else []
+
+
+class MemoryStorage(AbstractDBStorage):
+    """
+    Хранилище документов в памяти процесса для небольших каталогов, тестов и бенчмарков.
+    Повторяет фильтры, поиск и сортировку ElasticStorage.
+
+    При загрузке строятся индексы:
+    - порядки документов по каждому полю из sort_fields в обе стороны
+      (документы без значения поля - в конце, как в elastic) и ранги документов в них;
+    - инвертированные индексы id вложенных документов для фильтров;
+    - инвертированный индекс слов для полнотекстового поиска по search_fields.
+    Документы хранятся в списке, индексы ссылаются на их позиции.
+    """
+
+    def __init__(
+        self,
+        docs: Iterable[Dict],
+        sort_fields: Iterable[str] = ("id",),
+        search_fields: Iterable[str] = (),
+        filters: Optional[Dict[str, List[str]]] = None,
+    ):
+        self.docs = list(docs)
+        self.positions = {doc["id"]: position for position, doc in enumerate(self.docs)}
+        self.filters = filters or {}
+
+        # (поле, направление) -> позиции документов по порядку и ранг каждой позиции
+        self.orders: Dict[Tuple[str, str], List[int]] = {}
+        self.ranks: Dict[Tuple[str, str], List[int]] = {}
+        for field in sort_fields:
+            self.index_sort(field)
+
+        # вложенный список -> id вложенного документа -> позиции документов
+        self.nested_ids: Dict[str, Dict[str, Set[int]]] = defaultdict(lambda: defaultdict(set))
+        for path in {path for paths in self.filters.values() for path in paths}:
+            for position, doc in enumerate(self.docs):
+                for item in doc.get(path) or []:
+                    self.nested_ids[path][item["id"]].add(position)
+
+        # поле -> слово -> позиции документов
+        self.words: Dict[str, Dict[str, Set[int]]] = {}
+        for field in search_fields:
+            words = self.words[field] = defaultdict(set)
+            for position, doc in enumerate(self.docs):
+                for word in tokenize(doc.get(field)):
+                    words[word].add(position)
+
+    def index_sort(self, field: str) -> None:
+        present = [position for position, doc in enumerate(self.docs) if doc.get(field) is not None]
+        missing = [position for position, doc in enumerate(self.docs) if doc.get(field) is None]
+        # Сортировка устойчивая, равные значения остаются в порядке загрузки
+        present.sort(key=lambda position: self.docs[position][field])
+        descending = sorted(present, key=lambda position: self.docs[position][field], reverse=True)
+
+        for direction, order in (("asc", present + missing), ("desc", descending + missing)):
+            # Документы с равными значениями получают одинаковый ранг,
+            # чтобы при сортировке по нескольким полям их упорядочивали следующие поля
+            ranks = [0] * len(self.docs)
+            rank, previous = -1, object()
+            for position in order:
+                value = self.docs[position].get(field)
+                if value != previous:
+                    rank, previous = rank + 1, value
+                ranks[position] = rank
+            self.orders[(field, direction)] = order
+            self.ranks[(field, direction)] = ranks
+
+    async def get(self, id: Any, fields: Optional[Iterable[str]] = None) -> Optional[Dict]:
+        position = self.positions.get(str(id))
+        if position is None:
+            return None
+        return project(self.docs[position], fields)
+
+    async def get_many(
+        self, ids: Iterable[Any], fields: Optional[Iterable[str]] = None
+    ) -> List[Dict]:
+        positions = (self.positions.get(str(id)) for id in ids)
+        return [project(self.docs[p], fields) for p in positions if p is not None]
+
+    async def filter(
+        self,
+        filter_map: Optional[dict] = None,
+        search_map: Optional[dict] = None,
+        order_map: Optional[dict] = None,
+        offset: int = 0,
+        limit: int = DEFAULT_LIMIT,
+        fields: Optional[Iterable[str]] = None,
+        **kwargs,
+    ) -> Iterable[Dict]:
+        positions = self.find(filter_map or {}, search_map or {}, order_map or {})
+        return [project(self.docs[p], fields) for p in positions[offset : offset + limit]]
+
+    async def iterate(
+        self,
+        filter_map: Optional[dict] = None,
+        search_map: Optional[dict] = None,
+        order_map: Optional[dict] = None,
+        chunk_size: int = DEFAULT_LIMIT,
+        fields: Optional[Iterable[str]] = None,
+        **kwargs,
+    ) -> AsyncIterator[Dict]:
+        """Все документы находятся и сортируются один раз, без постраничных запросов"""
+        for position in self.find(filter_map or {}, search_map or {}, order_map or {}):
+            yield project(self.docs[position], fields)
+
+    def find(self, filter_map: Dict, search_map: Dict, order_map: Dict) -> List[int]:
+        """Позиции документов, подходящих под фильтры и поиск, в порядке выдачи"""
+        candidates = self.find_filtered(filter_map)
+
+        scores = None
+        if search_map:
+            field, text = list(search_map.items())[0]
+            scores = self.score(field, text, candidates)
+            candidates = set(scores)
+
+        if order_map:
+            return self.sort(candidates, order_map)
+        if scores is not None:
+            # Как и в elastic, без сортировки результаты поиска упорядочены по релевантности
+            return sorted(scores, key=lambda position: (-scores[position], position))
+        if candidates is None:
+            return list(range(len(self.docs)))
+        return sorted(candidates)
+
+    def find_filtered(self, filter_map: Dict) -> Optional[Set[int]]:
+        """Позиции документов, подходящих под все фильтры, None - если фильтров нет"""
+        candidates = None
+        for key, value in filter_map.items():
+            paths = self.filters.get(key)
+            if paths is None:
+                continue
+
+            ids = value if isinstance(value, (list, tuple, set)) else [value]
+            matched: Set[int] = set()
+            for path in paths:
+                nested_ids = self.nested_ids[path]
+                for id in ids:
+                    matched.update(nested_ids.get(str(id), ()))
+            candidates = matched if candidates is None else candidates & matched
+        return candidates
+
+    def score(self, field: str, text: str, candidates: Optional[Set[int]]) -> Dict[int, float]:
+        """
+        Релевантность документов запросу: сумма idf найденных слов запроса,
+        чтобы редкие слова весили больше частых, как в elastic
+        """
+        words = self.words.get(field, {})
+        scores: Dict[int, float] = defaultdict(float)
+        for word in set(tokenize(text)):
+            positions = words.get(word)
+            if not positions:
+                continue
+
+            idf = math.log(1 + len(self.docs) / len(positions))
+            for position in positions:
+                if candidates is None or position in candidates:
+                    scores[position] += idf
+        return scores
+
+    def sort(self, candidates: Optional[Set[int]], order_map: Dict) -> List[int]:
+        """Сортировка по рангам полей, документы с равными значениями - в порядке загрузки"""
+        keys = list(order_map.items())
+        if len(keys) == 1 and keys[0] in self.orders and candidates is None:
+            return list(self.orders[keys[0]])
+
+        for key in keys:
+            if key not in self.ranks:
+                self.index_sort(key[0])
+        ranks = [self.ranks[key] for key in keys]
+        positions = range(len(self.docs)) if candidates is None else candidates
+        if len(ranks) == 1:
+            (rank,) = ranks
+            return sorted(positions, key=lambda position: (rank[position], position))
+        return sorted(positions, key=lambda position: ([r[position] for r in ranks], position))
+
+
+def create_storages(docs_by_index: Dict[str, Iterable[Dict]]) -> None:
+    """Создает хранилища индексов из документов"""
+    for index_name, settings in INDEXES.items():
+        storages[index_name] = MemoryStorage(docs=docs_by_index.get(index_name, []), **settings)
+
+
+def load_storages(path: str) -> None:
+    """
+    Загружает хранилища индексов из каталога с файлами <индекс>.json,
+    каждый из которых содержит список документов индекса
+    """
+    docs_by_index = {}
+    for index_name in INDEXES:
+        index_path = os.path.join(path, f"{index_name}.json")
+        if os.path.exists(index_path):
+            with open(index_path, encoding="utf-8") as index_file:
+                docs_by_index[index_name] = json.load(index_file)
+    create_storages(docs_by_index)
+
+
+def get_genre_storage() -> MemoryStorage:
+    return storages["genres"]
+
+
+def get_film_storage() -> MemoryStorage:
+    return storages["movies"]
+
+
+def get_person_storage() -> MemoryStorage:
+    return storages["persons"]
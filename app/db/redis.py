@@ -1,11 +1,34 @@
+import asyncio
+import logging
 from functools import lru_cache
-from typing import Optional
+from itertools import chain
+from typing import Iterable, Optional, Set, Tuple
+from uuid import uuid4
 
-from aioredis import Redis
+from aioredis import Channel, Redis
 
-from db.base import AbstractCacheStorage
+from core import config
+from core.metrics import REDIS_REQUEST_DURATION
+from core.utils import jitter
+from db.base import AbstractCacheStorage, CacheKey
+from db.lru import TieredCacheStorage, get_local_cache_storage
 
-CACHE_EXPIRE_IN_SECONDS = 60
+logger = logging.getLogger(__name__)
+
+# Ключ живет в redis, пока его можно отдавать хотя бы как устаревший
+CACHE_EXPIRE_IN_SECONDS = config.CACHE_EXPIRE_IN_SECONDS + config.CACHE_STALE_IN_SECONDS
+
+# Задержка переподписки на канал сброса кеша после потери соединения, растет вдвое до максимума
+INVALIDATION_RECONNECT_MIN_DELAY = 0.1
+INVALIDATION_RECONNECT_MAX_DELAY = 30
+
+# Удаляет блокировку, только если она все еще принадлежит владельцу токена
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
 
 redis: Redis = None
 
@@ -14,22 +37,148 @@ async def get_redis() -> Redis:
     return redis
 
 
+def get_max_jittered_expire(expire: int) -> int:
+    """Наибольшее время жизни, которое может получить ключ после разброса в RedisStorage.set"""
+    return int(expire * (1 + config.CACHE_EXPIRE_JITTER)) + 1
+
+
 class RedisStorage(AbstractCacheStorage):
     """Хранилище redis для кэша"""
 
     def __init__(self, redis: Redis):
         self.redis = redis
 
-    async def get(self, key: str):
-        return await self.redis.get(key=key)
+    async def get(self, key: CacheKey) -> Optional[bytes]:
+        with REDIS_REQUEST_DURATION.labels(method="get").time():
+            return await self.redis.get(key=key)
+
+    async def get_with_tags(self, key: CacheKey) -> Tuple[Optional[bytes], Set[str]]:
+        """Значение и теги ключа одним запросом"""
+        pipe = self.redis.pipeline()
+        pipe.get(key)
+        pipe.smembers(self.get_key_tags_key(key))
+        with REDIS_REQUEST_DURATION.labels(method="get_with_tags").time():
+            value, tags = await pipe.execute()
+        return value, {tag.decode() for tag in tags}
 
-    async def set(self, key: str, value: str, expire: Optional[int] = None) -> None:
+    async def set(self, key: CacheKey, value: bytes, expire: Optional[int] = None) -> None:
         if expire is None:
             expire = CACHE_EXPIRE_IN_SECONDS
-        return await self.redis.set(key=key, value=value, expire=expire)
+        # Разброс времени жизни не дает ключам, записанным вместе, вместе и истечь
+        expire = max(1, round(jitter(expire, config.CACHE_EXPIRE_JITTER)))
+        with REDIS_REQUEST_DURATION.labels(method="set").time():
+            return await self.redis.set(key=key, value=value, expire=expire)
+
+    async def acquire_lock(self, key: CacheKey, expire: float) -> Optional[str]:
+        token = uuid4().hex
+        with REDIS_REQUEST_DURATION.labels(method="acquire_lock").time():
+            acquired = await self.redis.set(
+                key=self.get_lock_key(key),
+                value=token,
+                pexpire=int(expire * 1000),
+                exist=Redis.SET_IF_NOT_EXIST,
+            )
+        return token if acquired else None
+
+    async def release_lock(self, key: CacheKey, token: str) -> None:
+        await self.redis.eval(RELEASE_LOCK_SCRIPT, keys=[self.get_lock_key(key)], args=[token])
+
+    async def tag(self, key: CacheKey, tags: Iterable[str], expire: Optional[int] = None) -> None:
+        if expire is None:
+            expire = CACHE_EXPIRE_IN_SECONDS
+        # Индекс тегов должен жить не меньше значения с максимальным разбросом времени жизни,
+        # иначе сброс по событию etl не найдет еще живой ключ
+        expire = get_max_jittered_expire(expire)
+
+        tags = list(tags)
+        if not tags:
+            return
+
+        pipe = self.redis.pipeline()
+        for tag in tags:
+            tag_key = self.get_tag_key(tag)
+            pipe.sadd(tag_key, key)
+            pipe.expire(tag_key, expire)
+        # Обратный индекс: теги ключа, чтобы поднять их в локальный кеш вместе со значением
+        key_tags_key = self.get_key_tags_key(key)
+        pipe.sadd(key_tags_key, *tags)
+        pipe.expire(key_tags_key, expire)
+        with REDIS_REQUEST_DURATION.labels(method="tag").time():
+            await pipe.execute()
+
+    async def invalidate(self, tags: Iterable[str]) -> None:
+        tag_keys = [self.get_tag_key(tag) for tag in tags]
+        if not tag_keys:
+            return
+
+        pipe = self.redis.pipeline()
+        for tag_key in tag_keys:
+            pipe.smembers(tag_key)
+        keys = set(chain.from_iterable(await pipe.execute()))
+        key_tags_keys = [self.get_key_tags_key(key) for key in keys]
+        await self.redis.delete(*tag_keys, *keys, *key_tags_keys)
+
+    @staticmethod
+    def get_lock_key(key: CacheKey) -> bytes:
+        if isinstance(key, str):
+            key = key.encode()
+        return b"lock:" + key
+
+    @staticmethod
+    def get_tag_key(tag: str) -> str:
+        return f"tag:{tag}"
+
+    @staticmethod
+    def get_key_tags_key(key: CacheKey) -> bytes:
+        if isinstance(key, str):
+            key = key.encode()
+        return b"tags:" + key
+
+
+async def listen_invalidation_events(redis: Redis, cache_storage: AbstractCacheStorage) -> None:
+    """
+    Слушает события etl об изменении документов и сбрасывает кеш ответов, в которых они участвуют.
+    Событие содержит индекс и id измененных документов: {"index": "movies", "ids": [...]}.
+    При потере соединения с redis переподписывается на канал с растущей задержкой,
+    иначе сброс кеша молча прекратился бы до перезапуска процесса.
+    """
+    loop = asyncio.get_running_loop()
+    delay = INVALIDATION_RECONNECT_MIN_DELAY
+    while True:
+        try:
+            (channel,) = await redis.subscribe(config.CACHE_INVALIDATION_CHANNEL)
+            subscribed_at = loop.time()
+            await handle_invalidation_events(channel, cache_storage)
+            # Задержка сбрасывается, только если соединение продержалось, а не обрывается сразу
+            if loop.time() - subscribed_at > INVALIDATION_RECONNECT_MAX_DELAY:
+                delay = INVALIDATION_RECONNECT_MIN_DELAY
+            logger.warning(
+                "Cache invalidation channel connection lost, resubscribing in %.1fs", delay
+            )
+        except Exception:
+            logger.exception("Cache invalidation listener failed, resubscribing in %.1fs", delay)
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, INVALIDATION_RECONNECT_MAX_DELAY)
+
+
+async def handle_invalidation_events(channel: Channel, cache_storage: AbstractCacheStorage) -> None:
+    """Обрабатывает события канала, пока соединение не закрыто"""
+    while await channel.wait_message():
+        try:
+            event = await channel.get_json()
+            tags = [get_index_tag(event["index"]), *event.get("ids", [])]
+            await cache_storage.invalidate(tags)
+        except Exception:
+            logger.exception("Failed to handle cache invalidation event")
+
+
+def get_index_tag(index_name: str) -> str:
+    """Тег для списков документов индекса: сбрасывается при любом изменении в индексе"""
+    return f"index:{index_name}"
 
 
 @lru_cache()
-async def get_cache_storage() -> RedisStorage:
+async def get_cache_storage() -> AbstractCacheStorage:
     redis = await get_redis()
-    return RedisStorage(redis=redis)
+    return TieredCacheStorage(local=get_local_cache_storage(), remote=RedisStorage(redis=redis))
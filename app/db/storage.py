@@ -0,0 +1,27 @@
+from elasticsearch import AsyncElasticsearch
+from fastapi import Depends
+
+from core import config
+from db import elastic, memory
+from db.base import AbstractDBStorage
+from db.elastic import get_elastic
+
+# Хранилища документов для сервисов выбираются настройкой DB_STORAGE
+
+
+def get_genre_storage(es: AsyncElasticsearch = Depends(get_elastic)) -> AbstractDBStorage:
+    if config.DB_STORAGE == config.DB_STORAGE_MEMORY:
+        return memory.get_genre_storage()
+    return elastic.get_genre_storage(es)
+
+
+def get_film_storage(es: AsyncElasticsearch = Depends(get_elastic)) -> AbstractDBStorage:
+    if config.DB_STORAGE == config.DB_STORAGE_MEMORY:
+        return memory.get_film_storage()
+    return elastic.get_film_storage(es)
+
+
+def get_person_storage(es: AsyncElasticsearch = Depends(get_elastic)) -> AbstractDBStorage:
+    if config.DB_STORAGE == config.DB_STORAGE_MEMORY:
+        return memory.get_person_storage()
+    return elastic.get_person_storage(es)
@@ -1,20 +1,24 @@
+import asyncio
 import logging
 
 import aioredis
 import uvicorn as uvicorn
 from elasticsearch import AsyncElasticsearch
-from fastapi import FastAPI, Request
-from fastapi.responses import ORJSONResponse, RedirectResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
 from api.v1 import film, genre, person
-from core import config, json
+from core import config
 from core.logger import LOGGING
-from core.utils import async_iterator_wrapper
-from db import elastic, redis
-from db.base import AbstractCacheStorage
-from db.redis import get_cache_storage
+from core.metrics import METRICS_PATH, metrics
+from core.middleware import (
+    CacheMiddleware,
+    MetricsMiddleware,
+    ProfilerMiddleware,
+    ServerTimingMiddleware,
+)
+from db import elastic, memory, redis
+from db.redis import get_cache_storage, get_index_tag, listen_invalidation_events
 
 app = FastAPI(
     title=config.PROJECT_NAME,
@@ -23,32 +27,12 @@ app = FastAPI(
     default_response_class=ORJSONResponse,
 )
 
-
-class CacheMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp, cache_storage: AbstractCacheStorage):
-        super().__init__(app)
-        self.cache_storage = cache_storage
-
-    async def dispatch(self, request: Request, call_next):
-        key = request["raw_path"] + request.get("query_string", "")
-        data_in_cache = await self.cache_storage.get(key=key)
-
-        if data_in_cache:
-            return ORJSONResponse(content=json.loads(data_in_cache))
-
-        response = await call_next(request)
-
-        if response.status_code == 307:
-            return RedirectResponse(url=response.headers.get("location"))
-
-        resp_body = [section async for section in response.__dict__["body_iterator"]]
-        response.__setattr__("body_iterator", async_iterator_wrapper(resp_body))
-        resp_body = resp_body[0]
-
-        if key not in (b"/api/openapi", b"/api/openapi.json"):
-            await self.cache_storage.set(key=key, value=resp_body)
-
-        return response
+# Индексы, от которых зависят списки и поиск по префиксу пути, для сброса кеша по событиям etl
+CACHE_PATH_TAGS = {
+    "/api/v1/film": [get_index_tag("movies")],
+    "/api/v1/genre": [get_index_tag("genres")],
+    "/api/v1/person": [get_index_tag("persons"), get_index_tag("movies")],
+}
 
 
 @app.on_event("startup")
@@ -58,13 +42,28 @@ async def startup():
     Подключиться можем при работающем event-loop
     Поэтому логика подключения происходит в асинхронной функции
     """
-    redis.redis = await aioredis.create_redis_pool(
-        config.REDIS_DSN, minsize=10, maxsize=20, encoding="utf-8"
-    )
-    elastic.es = AsyncElasticsearch(hosts=[config.ELASTIC_DSN])
+    # Значения в кеше хранятся как байты (в том числе сжатые), поэтому без декодирования
+    redis.redis = await aioredis.create_redis_pool(config.REDIS_DSN, minsize=10, maxsize=20)
+    if config.DB_STORAGE == config.DB_STORAGE_MEMORY:
+        memory.load_storages(config.MEMORY_STORAGE_PATH)
+    else:
+        elastic.es = AsyncElasticsearch(hosts=[config.ELASTIC_DSN])
 
     cache_storage = await get_cache_storage()
-    app.add_middleware(CacheMiddleware, cache_storage=cache_storage)
+    app.add_middleware(
+        CacheMiddleware,
+        cache_storage=cache_storage,
+        routes=app.routes,
+        path_tags=CACHE_PATH_TAGS,
+    )
+    # Добавлен последним, поэтому внешний: время ответов из кеша тоже учитывается
+    app.add_middleware(MetricsMiddleware, routes=app.routes)
+    app.add_middleware(ServerTimingMiddleware)
+    # Внешний для всех остальных: в профиль попадает и работа middleware
+    app.add_middleware(ProfilerMiddleware)
+    app.state.invalidation_listener = asyncio.create_task(
+        listen_invalidation_events(redis=redis.redis, cache_storage=cache_storage)
+    )
 
 
 @app.on_event("shutdown")
@@ -72,8 +71,10 @@ async def shutdown():
     """
     Отключаемся от баз при выключении сервера
     """
+    app.state.invalidation_listener.cancel()
     await redis.redis.close()
-    await elastic.es.close()
+    if elastic.es is not None:
+        await elastic.es.close()
 
 
 # Подключаем роутер к серверу, указав префикс /v1/film
@@ -81,6 +82,7 @@ async def shutdown():
 app.include_router(film.router, prefix="/api/v1/film", tags=["film"])
 app.include_router(genre.router, prefix="/api/v1/genre", tags=["genre"])
 app.include_router(person.router, prefix="/api/v1/person", tags=["person"])
+app.add_route(METRICS_PATH, metrics, include_in_schema=False)
 
 if __name__ == "__main__":
     uvicorn.run(
@@ -15,6 +15,14 @@ class Genre(BaseModel):
     name: str
 
 
+class FilmShort(BaseModel):
+    """Краткие данные фильма для списков и поиска"""
+
+    id: UUID4
+    title: str
+    imdb_rating: Optional[float]
+
+
 class Film(BaseModel):
     id: UUID4
     title: str
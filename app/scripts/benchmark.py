@@ -0,0 +1,251 @@
+"""
+Бенчмарк горячих путей api без внешних сервисов.
+
+Документы жанров, персон и фильмов строятся из дампа postgres так же, как их строит etl,
+и загружаются в MemoryStorage, кеш ответов - в LRUCacheStorage.
+Запросы к роутерам film, genre и person отправляются напрямую в ASGI-приложение,
+для каждого сценария выводятся пропускная способность и p50/p95/p99 задержки
+без кеша (каждый запрос идет в хранилище) и с кешем (все ответы уже в кеше).
+
+Запуск из каталога app:
+    python -m scripts.benchmark --requests 1000 --concurrency 10
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import time
+from collections import defaultdict
+from itertools import cycle, islice
+from typing import Any, Dict, List, Optional, Tuple
+
+from main import CACHE_PATH_TAGS, app
+from starlette.types import ASGIApp, Message
+
+from core import config, json
+from core.middleware import CacheMiddleware
+from db import memory
+from db.lru import LRUCacheStorage
+
+DUMP_PATH = os.path.join(os.path.dirname(config.BASE_DIR), "dumps", "movies_db.sql")
+
+COPY_RE = re.compile(r"^COPY public\.(\w+) \((.*)\) FROM stdin;$")
+COPY_ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "\\": "\\"}
+
+# Количество разных запросов в сценарии, по которым идут запросы по кругу
+SCENARIO_SAMPLE_SIZE = 100
+
+
+def read_copy_tables(path: str) -> Dict[str, List[Dict[str, Optional[str]]]]:
+    """Читает строки таблиц из блоков COPY ... FROM stdin дампа pg_dump"""
+    tables = defaultdict(list)
+    with open(path, encoding="utf-8") as dump_file:
+        table: Optional[str] = None
+        columns: List[str] = []
+        for line in dump_file:
+            line = line.rstrip("\n")
+            if table is None:
+                match = COPY_RE.match(line)
+                if match:
+                    table, columns = match.group(1), match.group(2).split(", ")
+                continue
+
+            if line == "\\.":
+                table = None
+                continue
+
+            values = [unescape_copy_value(value) for value in line.split("\t")]
+            tables[table].append(dict(zip(columns, values)))
+    return tables
+
+
+def unescape_copy_value(value: str) -> Optional[str]:
+    if value == "\\N":
+        return None
+    return re.sub(r"\\(.)", lambda m: COPY_ESCAPES.get(m.group(1), m.group(1)), value)
+
+
+def build_documents(tables: Dict[str, List[Dict]]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """Документы индексов genres, persons и movies в том виде, в каком их загружает etl"""
+    genres = {g["id"]: {"id": g["id"], "name": g["name"]} for g in tables["movies_genre"]}
+    persons = {
+        p["id"]: {"id": p["id"], "full_name": f"{p['first_name']} {p['last_name']}"}
+        for p in tables["movies_person"]
+    }
+
+    movies = {}
+    for filmwork in tables["movies_filmwork"]:
+        movies[filmwork["id"]] = {
+            "id": filmwork["id"],
+            "filmwork_type": filmwork["filmwork_type"],
+            "title": filmwork["title"],
+            "description": filmwork["description"],
+            "imdb_rating": float(filmwork["rating"]) if filmwork["rating"] else None,
+            "genres": [],
+            **{f"{role}s": [] for role in memory.ROLES},
+        }
+    for filmwork_genre in tables["movies_filmwork_genres"]:
+        movies[filmwork_genre["filmwork_id"]]["genres"].append(genres[filmwork_genre["genre_id"]])
+    for participant in tables["movies_filmwork_participants"]:
+        movies[participant["filmwork_id"]][f"{participant['role']}s"].append(
+            persons[participant["person_id"]]
+        )
+
+    return list(genres.values()), list(persons.values()), list(movies.values())
+
+
+def get_scenarios(
+    genres: List[Dict], persons: List[Dict], movies: List[Dict]
+) -> Dict[str, List[str]]:
+    """Сценарии нагрузки: для каждого - список путей с query-параметрами"""
+    genre_ids = [genre["id"] for genre in genres][:SCENARIO_SAMPLE_SIZE]
+    person_ids = [person["id"] for person in persons][:SCENARIO_SAMPLE_SIZE]
+    film_ids = [film["id"] for film in movies][:SCENARIO_SAMPLE_SIZE]
+    titles = [film["title"].split()[0] for film in movies][:SCENARIO_SAMPLE_SIZE]
+    names = [person["full_name"].split()[-1] for person in persons][:SCENARIO_SAMPLE_SIZE]
+
+    return {
+        "film_details": [f"/api/v1/film/{film_id}/" for film_id in film_ids],
+        "film_list": [f"/api/v1/film/?page[number]={page}" for page in range(1, 6)],
+        "film_list_genre": [f"/api/v1/film/?filter[genre]={genre_id}" for genre_id in genre_ids],
+        "film_list_cursor": ["/api/v1/film/?page[cursor]="],
+        "film_batch": [
+            "/api/v1/film/batch/?" + "&".join(f"ids={film_id}" for film_id in film_ids[i : i + 20])
+            for i in range(0, len(film_ids), 20)
+        ],
+        "film_search": [f"/api/v1/film/search/?query={title}" for title in titles],
+        "genre_details": [f"/api/v1/genre/{genre_id}/" for genre_id in genre_ids],
+        "genre_list": ["/api/v1/genre/?size=50"],
+        "person_details": [f"/api/v1/person/{person_id}/" for person_id in person_ids],
+        "person_films": [f"/api/v1/person/{person_id}/film/" for person_id in person_ids],
+        "person_search": [f"/api/v1/person/search/?query={name}" for name in names],
+    }
+
+
+async def request(asgi_app: ASGIApp, url: str) -> Tuple[int, float]:
+    """Отправляет GET-запрос в ASGI-приложение, возвращает статус и время ответа"""
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [(b"host", b"benchmark"), (b"accept-encoding", b"gzip")],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    status = 0
+
+    async def receive() -> Message:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Message) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    start = time.perf_counter()
+    await asgi_app(scope, receive, send)
+    return status, time.perf_counter() - start
+
+
+async def run_scenario(
+    asgi_app: ASGIApp, urls: List[str], requests: int, concurrency: int
+) -> Dict[str, Any]:
+    """Выполняет requests запросов по urls по кругу в concurrency параллельных потоков"""
+    queue = iter(islice(cycle(urls), requests))
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        for url in queue:
+            status, latency = await request(asgi_app, url)
+            latencies.append(latency)
+            if status >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentiles[49] * 1000,
+        "p95_ms": percentiles[94] * 1000,
+        "p99_ms": percentiles[98] * 1000,
+    }
+
+
+def get_apps(genres: List[Dict], persons: List[Dict], movies: List[Dict]) -> Dict[str, ASGIApp]:
+    """Приложение без кеша и то же приложение за CacheMiddleware с кешем в памяти"""
+    config.DB_STORAGE = config.DB_STORAGE_MEMORY
+    memory.create_storages({"genres": genres, "persons": persons, "movies": movies})
+
+    cache_storage = LRUCacheStorage(max_size=1024**3, expire=60 * 60)
+    return {
+        "uncached": app,
+        "cached": CacheMiddleware(
+            app, cache_storage=cache_storage, routes=app.routes, path_tags=CACHE_PATH_TAGS
+        ),
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    genres, persons, movies = build_documents(read_copy_tables(args.dump))
+    scenarios = get_scenarios(genres, persons, movies)
+    if args.scenario:
+        scenarios = {name: scenarios[name] for name in args.scenario}
+    apps = get_apps(genres, persons, movies)
+
+    results = []
+    for name, urls in scenarios.items():
+        for mode, asgi_app in apps.items():
+            # Прогрев: заполняет кеш всеми запросами сценария
+            for url in urls:
+                await request(asgi_app, url)
+            result = await run_scenario(asgi_app, urls, args.requests, args.concurrency)
+            results.append({"scenario": name, "mode": mode, **result})
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument("--dump", default=DUMP_PATH, help="дамп postgres с данными")
+    parser.add_argument("--requests", type=int, default=1000, help="запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=10, help="параллельных запросов")
+    parser.add_argument("--scenario", action="append", help="запустить только этот сценарий")
+    parser.add_argument("--json", action="store_true", help="вывести результаты в json")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(results))
+        return
+
+    print(
+        f"{'scenario':<18}{'mode':<10}{'requests':>9}{'errors':>8}"
+        f"{'rps':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    )
+    for r in results:
+        print(
+            f"{r['scenario']:<18}{r['mode']:<10}{r['requests']:>9}{r['errors']:>8}"
+            f"{r['rps']:>10.0f}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,63 @@
 from functools import lru_cache
-from typing import Dict, Iterable, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from elasticsearch import AsyncElasticsearch
 from fastapi import Depends
 
+from core.models import get_model_fields
 from db.base import AbstractDBStorage
-from db.elastic import get_elastic, get_film_storage
-from models.film import Film
+from db.elastic import get_elastic
+from db.storage import get_film_storage
+from models.film import Film, FilmShort
+
+# Поля документа фильма для детальной информации и для списков и поиска
+FILM_FIELDS = get_model_fields(Film)
+FILM_SHORT_FIELDS = get_model_fields(FilmShort)
 
 
 class FilmService:
+    """
+    Бизнес логика получения фильмов.
+    Методы возвращают документы хранилища только с полями моделей Film и FilmShort.
+    """
+
     def __init__(self, film_storage: AbstractDBStorage):
         self.film_storage = film_storage
 
-    async def get_by_id(self, film_id: str) -> Optional[Film]:
-        res = await self.film_storage.get(id=film_id)
-        if not res:
-            return None
-        return Film(**res)
+    async def get_by_id(self, film_id: str) -> Optional[Dict]:
+        return await self.film_storage.get(id=film_id, fields=FILM_FIELDS)
+
+    async def get_by_ids(self, film_ids: Iterable[Any]) -> List[Dict]:
+        """Метод получения фильмов по списку id, ненайденные фильмы пропускаются"""
+        return await self.film_storage.get_many(ids=film_ids, fields=FILM_FIELDS)
 
     async def get_page(
         self, filter_map: dict, page_number: int, page_size: int, sort_value: str, sort_order: str
-    ) -> Iterable[Film]:
-        res = await self.film_storage.page(
+    ) -> Iterable[Dict]:
+        return await self.film_storage.page(
             filter_map=filter_map,
             order_map={sort_value: sort_order},
             page=page_number,
             page_size=page_size,
+            fields=FILM_SHORT_FIELDS,
+        )
+
+    async def get_cursor_page(
+        self,
+        filter_map: dict,
+        cursor: Optional[str],
+        page_size: int,
+        sort_value: str,
+        sort_order: str,
+    ) -> Tuple[Iterable[Dict], Optional[str]]:
+        """Метод получения страницы фильмов по курсору"""
+        return await self.film_storage.cursor_page(
+            filter_map=filter_map,
+            order_map={sort_value: sort_order},
+            cursor=cursor,
+            page_size=page_size,
+            fields=FILM_SHORT_FIELDS,
         )
-        return (Film(**g) for g in res)
 
     async def search(self, page: int, size: int, match_obj: str) -> Iterable[Dict]:
         """Метод поиска фильмов по названию"""
@@ -36,6 +65,7 @@ class FilmService:
             search_map={"title": match_obj},
             page=page,
             page_size=size,
+            fields=FILM_SHORT_FIELDS,
         )
 
 
@@ -1,34 +1,48 @@
 from functools import lru_cache
-from typing import Iterable, Optional
+from typing import Dict, Iterable, Optional, Tuple
 
 from fastapi import Depends
 
+from core.models import get_model_fields
 from db.base import AbstractDBStorage
-from db.elastic import get_genre_storage
+from db.storage import get_genre_storage
 from models.genre import Genre
 
+# Поля документа жанра, которые отдаются в ответах
+GENRE_FIELDS = get_model_fields(Genre)
+
 
 class GenreService:
-    """Бизнесс логика получения жанров"""
+    """
+    Бизнесс логика получения жанров.
+    Методы возвращают документы хранилища только с полями модели Genre.
+    """
 
     def __init__(self, genre_storage: AbstractDBStorage):
         self.genre_storage = genre_storage
 
-    async def get_by_id(self, genre_id: str) -> Optional[Genre]:
+    async def get_by_id(self, genre_id: str) -> Optional[Dict]:
         """Метод получения данных о жанре"""
-        res = await self.genre_storage.get(id=genre_id)
-        if not res:
-            return None
-        return Genre(**res)
+        return await self.genre_storage.get(id=genre_id, fields=GENRE_FIELDS)
 
     async def get_genres_list(
         self, page: int, size: int, sort_value: str, sort_order: str
-    ) -> Iterable[Genre]:
+    ) -> Iterable[Dict]:
         """Метод получения данных о списке жанров из elastic"""
-        res = await self.genre_storage.page(
-            order_map={sort_value: sort_order}, page=page, page_size=size
+        return await self.genre_storage.page(
+            order_map={sort_value: sort_order}, page=page, page_size=size, fields=GENRE_FIELDS
+        )
+
+    async def get_genres_cursor_page(
+        self, cursor: Optional[str], size: int, sort_value: str, sort_order: str
+    ) -> Tuple[Iterable[Dict], Optional[str]]:
+        """Метод получения страницы жанров по курсору"""
+        return await self.genre_storage.cursor_page(
+            order_map={sort_value: sort_order},
+            cursor=cursor,
+            page_size=size,
+            fields=GENRE_FIELDS,
         )
-        return (Genre(**g) for g in res)
 
 
 @lru_cache()
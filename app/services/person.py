@@ -1,79 +1,144 @@
+import asyncio
 from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 
 from fastapi import Depends
 
+from core.models import get_model_fields
 from db.base import AbstractDBStorage
-from db.elastic import get_film_storage, get_person_storage
+from db.storage import get_film_storage, get_person_storage
 from models.person import Person, RoleType
 
 PERSON_CACHE_EXPIRE_IN_SECONDS = 60 * 5
 
+# Поля документа персоны, которые отдаются в ответах
+PERSON_FIELDS = get_model_fields(Person)
+
+# Размер пачки при потоковом чтении фильмов персон
+PERSON_FILMS_CHUNK_SIZE = 500
+# Поля фильмов, нужные для ролей и фильмографии персон: из участников достаточно id
+PERSON_FILMS_FIELDS = [
+    "id",
+    "title",
+    "imdb_rating",
+    *(f"{role.value}s.id" for role in RoleType),
+]
+
 
 class PersonService:
-    """Бизнес логика получения персон."""
+    """
+    Бизнес логика получения персон.
+    Методы возвращают документы хранилища, дополненные ролями и фильмами персон.
+    """
 
     def __init__(self, person_storage: AbstractDBStorage, film_storage: AbstractDBStorage):
         self.person_storage = person_storage
         self.film_storage = film_storage
 
-    async def get_by_id(self, person_id: str) -> Optional[Tuple[Person, List[str], List[str]]]:
+    async def get_by_id(
+        self, person_id: str
+    ) -> Tuple[Optional[Dict], Optional[List[str]], Optional[List[str]]]:
         """Метод получения данных о персоне."""
-        person = await self.person_storage.get(id=person_id)
+        # Данные персоны и её фильмов независимы, запрашиваем их параллельно
+        person, films = await asyncio.gather(
+            self.person_storage.get(id=person_id, fields=PERSON_FIELDS),
+            self.get_person_film_data(person_id),
+        )
         if not person:
             return None, None, None
 
-        films = await self.get_person_film_data(person_id)
-        film_ids = set()
-        person_roles = []
-        for role, film in films.items():
-            person_roles.append(role)
-            film_ids.update({film_param["id"] for film_param in film})
-
-        return Person(**person), person_roles, sorted(list(film_ids))
+        person_roles, film_ids = self.get_person_roles_and_film_ids(films)
+        return person, person_roles, film_ids
 
     async def get_person_film_list(self, person_id: str) -> Optional[List[Dict]]:
         """Метод получения списка фильмов в которых принимала участие персона."""
 
-        person = await self.person_storage.get(person_id)
+        person, films = await asyncio.gather(
+            self.person_storage.get(person_id, fields=["id"]), self.get_person_film_data(person_id)
+        )
         if not person:
             return []
 
-        films = await self.get_person_film_data(person["id"])
         person_films = {}
         for role, film in films.items():
             for film_param in film:
                 if film_param["id"] not in person_films:
-                    film_param["roles"] = [role]
-                    person_films[film_param["id"]] = film_param
+                    person_films[film_param["id"]] = {
+                        "id": film_param["id"],
+                        "title": film_param["title"],
+                        "imdb_rating": film_param["imdb_rating"],
+                        "roles": [role],
+                    }
                 else:
                     person_films[film_param["id"]]["roles"].append(role)
         return [film_param for film_param in person_films.values()]
 
     async def search_person_by_full_name(
         self, page: int, size: int, match_obj: str
-    ) -> Optional[List[Tuple[Person, List[str], List[str]]]]:
+    ) -> List[Tuple[Dict, List[str], List[str]]]:
         """Метод поиска персон по полному имени"""
         persons = await self.person_storage.page(
-            search_map={"full_name": match_obj}, page=page, page_size=size
+            search_map={"full_name": match_obj}, page=page, page_size=size, fields=PERSON_FIELDS
         )
+        persons = list(persons)
+        films_by_person = await self.get_persons_film_data([person["id"] for person in persons])
+
         full_persons_data = []
         for person in persons:
-            person, person_roles, film_ids = await self.get_by_id(person["id"])
+            person_roles, film_ids = self.get_person_roles_and_film_ids(
+                films_by_person.get(person["id"], {})
+            )
             full_persons_data.append((person, person_roles, film_ids))
         return full_persons_data
 
     async def get_person_film_data(self, person_id: str) -> Dict:
-        """Метод возвращает данные фильмов в которых учавствовала персона."""
-        person_films_data = {}
+        """
+        Метод возвращает данные фильмов в которых учавствовала персона.
+        Фильмы по всем ролям получаются одним запросом и раскладываются по ролям.
+        """
+        person_id = str(person_id)
+        persons_films_data = await self.get_persons_film_data([person_id])
+        return persons_films_data[person_id]
+
+    async def get_persons_film_data(self, person_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Метод возвращает данные всех фильмов для списка персон.
+        Фильмы читаются из хранилища потоком пачками, без ограничения на их количество.
+        Результат сгруппирован по id персоны, а затем по роли.
+        """
+        if not person_ids:
+            return {}
+
         all_roles = [role.value for role in RoleType]
-        for role in all_roles:
-            films = await self.film_storage.filter(
-                filter_map={f"{role}_id": person_id}, order_map={"id": "asc"}
-            )
-            if films:
-                person_films_data[role] = [film for film in films]
-        return person_films_data
+        films = self.film_storage.iterate(
+            filter_map={"person_ids": person_ids},
+            order_map={"id": "asc"},
+            chunk_size=PERSON_FILMS_CHUNK_SIZE,
+            fields=PERSON_FILMS_FIELDS,
+        )
+
+        persons_films_data: Dict[str, Dict] = {person_id: {} for person_id in person_ids}
+        async for film in films:
+            for role in all_roles:
+                participant_ids = {participant["id"] for participant in film.get(f"{role}s", [])}
+                for person_id in participant_ids & persons_films_data.keys():
+                    persons_films_data[person_id].setdefault(role, []).append(film)
+
+        # Порядок ролей должен совпадать с порядком в RoleType
+        return {
+            person_id: {role: films_data[role] for role in all_roles if role in films_data}
+            for person_id, films_data in persons_films_data.items()
+        }
+
+    @staticmethod
+    def get_person_roles_and_film_ids(films: Dict) -> Tuple[List[str], List[str]]:
+        """Метод возвращает роли персоны и отсортированный список id её фильмов."""
+        film_ids = set()
+        person_roles = []
+        for role, film in films.items():
+            person_roles.append(role)
+            film_ids.update({film_param["id"] for film_param in film})
+        return person_roles, sorted(list(film_ids))
 
 
 @lru_cache()
@@ -1,13 +1,12 @@
+import asyncio
 from datetime import datetime
-from time import sleep
-from typing import Callable, List
+from typing import Callable, List, Optional
 
-from pydantic import AnyHttpUrl, BaseSettings, PostgresDsn
+from pipeline import Stage, run_pipeline
+from pydantic import AnyHttpUrl, BaseSettings, PostgresDsn, RedisDsn
 from repo import BaseRepository, FilmworkRepository, GenreRepository, PersonRepository
-from storage import ElasticWriter, JsonFileStorage, PGReader, State
-from utils import coroutine, get_logger, load_indexes, logger
-
-from models import Filmwork
+from storage import CacheInvalidator, ElasticWriter, JsonFileStorage, PGReader, State
+from utils import get_logger, load_indexes
 
 
 class Settings(BaseSettings):
@@ -15,31 +14,60 @@ class Settings(BaseSettings):
     postgres_dsn: PostgresDsn
     local_storage_path: str = "/var/lib/ymp/etl.json"
     chunk_size: int = 100
-
-
-def beat_coro(
-    get_last_timestamp: Callable[[], datetime],
-    set_last_timestamp: Callable[[datetime], None],
-    consumers_coro,
+    # Размер пула соединений с postgres
+    postgres_min_connections: int = 1
+    postgres_max_connections: int = 10
+    # Redis для публикации событий сброса кеша api, если не указан - события не публикуются
+    redis_dsn: Optional[RedisDsn] = None
+    cache_invalidation_channel: str = "cache:invalidate"
+    # Количество параллельных обработчиков этапов пайплайна и размер очередей между ними
+    transform_concurrency: int = 1
+    load_concurrency: int = 2
+    pipeline_queue_size: int = 2
+
+
+async def beat(
+    get_last_timestamp: Callable[[str], datetime],
+    set_last_timestamp: Callable[[str, datetime], None],
+    etls: List["BaseEtl"],
 ):
     """
     Корутина для запуска процесса etl.
-    1. Получает последнее время синхронизации данных
-    2. Передает время обновлении другим корутинам для получения списка обновленных фильмов
-    3. После успешной загрузки данных в elastic обновляет последнее время синхронизации
+    Пайплайны запускаются одновременно, поэтому длительность итерации определяется самым
+    медленным из них. Каждый пайплайн хранит свое время синхронизации, и ошибка в одном
+    пайплайне не мешает остальным: его время не обновляется, и данные загружаются
+    повторно на следующей итерации.
     """
     while True:
-        new_timestamp = datetime.utcnow()
-        last_timestamp = get_last_timestamp()
-        logger.info(f'Starting etl process for last timestamp "{last_timestamp}"')
+        await asyncio.gather(
+            *(beat_etl(etl, get_last_timestamp, set_last_timestamp) for etl in etls)
+        )
+        await asyncio.sleep(10)
 
-        for consumer in consumers_coro:
-            consumer.send(last_timestamp)
 
-        logger.info(f'Set new last timestamp to "{new_timestamp}"')
-        set_last_timestamp(new_timestamp)
+async def beat_etl(
+    etl: "BaseEtl",
+    get_last_timestamp: Callable[[str], datetime],
+    set_last_timestamp: Callable[[str, datetime], None],
+) -> None:
+    """
+    Итерация одного пайплайна.
+    1. Получает последнее время синхронизации данных пайплайна
+    2. Запускает пайплайн для данных, обновленных после этого времени
+    3. После успешной загрузки данных в elastic обновляет последнее время синхронизации
+    """
+    new_timestamp = datetime.utcnow()
+    last_timestamp = get_last_timestamp(etl.etl_name)
+    etl.logger.info(f'Starting etl process for last timestamp "{last_timestamp}"')
+
+    try:
+        await etl.run(last_timestamp)
+    except Exception:
+        etl.logger.exception("Etl process failed, it will be retried on the next beat")
+        return
 
-        sleep(10)
+    etl.logger.info(f'Set new last timestamp to "{new_timestamp}"')
+    set_last_timestamp(etl.etl_name, new_timestamp)
 
 
 class BaseEtl:
@@ -49,40 +77,46 @@ class BaseEtl:
 
     etl_name: str = ""
 
-    def __init__(self, repo: BaseRepository, chunk_size: int = 100):
+    def __init__(
+        self,
+        repo: BaseRepository,
+        chunk_size: int = 100,
+        cache_invalidator: Optional[CacheInvalidator] = None,
+        transform_concurrency: int = 1,
+        load_concurrency: int = 1,
+        queue_size: int = 2,
+    ):
         self.repo = repo
         self.chunk_size = chunk_size
+        self.cache_invalidator = cache_invalidator
+        self.transform_concurrency = transform_concurrency
+        self.load_concurrency = load_concurrency
+        self.queue_size = queue_size
         self.logger = get_logger(self.etl_name)
 
-    def get_pipeline(self):
+    async def run(self, last_timestamp: datetime) -> None:
         """
-        Формирует корутину для обработки etl пайплайна
+        Пайплайн etl: получение обновленных данных, добавление недостающих данных
+        и обновление документов в индексе. Этапы работают одновременно,
+        блокирующие запросы к postgres и elastic выполняются в пуле потоков
         """
-        # Обновление данных в индексе
-        update_index_coro = self.update_items_index()
-        # Добавление недостающих данных
-        enrich_items_coro = self.enrich_items(consumer=update_index_coro)
-        # Получение обновленных данных
-        get_modified_items_coro = self.get_modified_items(consumer=enrich_items_coro)
-        return get_modified_items_coro
-
-    @coroutine
-    def get_modified_items(self, consumer):
-        while last_timestamp := (yield):
-            for items in self.repo.get_modified_items(last_timestamp, chunk_size=self.chunk_size):
-                consumer.send(items)
-
-    @coroutine
-    def enrich_items(self, consumer):
-        while items := (yield):
-            enriched_items = self.enrich_items_chunk(items)
-            consumer.send(enriched_items)
-
-    @coroutine
-    def update_items_index(self):
-        while items := (yield):
-            self.repo.update_items_index(items)
-            self.logger.info(f'Updated index for "{len(items)}" items.')
+        await run_pipeline(
+            source=self.repo.get_modified_items(last_timestamp, chunk_size=self.chunk_size),
+            stages=[
+                Stage("enrich", self.enrich_items_chunk, self.transform_concurrency),
+                Stage("load", self.update_items_index, self.load_concurrency),
+            ],
+            queue_size=self.queue_size,
+        )
+
+    def update_items_index(self, items) -> None:
+        self.repo.update_items_index(items)
+        self.logger.info(f'Updated index for "{len(items)}" items.')
+
+        if self.cache_invalidator:
+            self.cache_invalidator.invalidate(
+                index_name=self.repo.index_name, ids=self.repo.get_related_ids(items)
+            )
 
     def enrich_items_chunk(self, items):
         return items
@@ -97,27 +131,12 @@ class PersonEtl(BaseEtl):
 
 
 class FilmworkEtl(BaseEtl):
-    etl_name = "filmwork"
-
-    def enrich_items_chunk(self, items: List[Filmwork]):
-        filmworks_ids = [f.id for f in items]
-        filmworks_participants_map = self.repo.get_filmworks_participants(filmworks_ids)
-        filmworks_genres_map = self.repo.get_filmworks_genres(filmworks_ids)
-
-        enriched_filmworks = []
-        for filmwork in items:
-            for person in filmworks_participants_map.get(filmwork.id, []):
-                acc_field = {
-                    "director": filmwork.directors,
-                    "writer": filmwork.writers,
-                    "actor": filmwork.actors,
-                }[person.role]
-                acc_field.append({"id": person.id, "full_name": person.full_name})
-
-            filmwork.genres = filmworks_genres_map.get(filmwork.id, [])
-            enriched_filmworks.append(filmwork)
+    """
+    Жанры и участники фильмов получаются вместе с фильмами одним запросом,
+    поэтому дополнять пачку не нужно
+    """
 
-        return enriched_filmworks
+    etl_name = "filmwork"
 
 
 def main():
@@ -125,8 +144,17 @@ def main():
     load_indexes(es_dsn=settings.elastic_dsn)
     # Клиенты для хранилищ
     state_storage = State(JsonFileStorage(str(settings.local_storage_path)))
-    pg_reader = PGReader(str(settings.postgres_dsn))
+    pg_reader = PGReader(
+        str(settings.postgres_dsn),
+        min_connections=settings.postgres_min_connections,
+        max_connections=settings.postgres_max_connections,
+    )
     elastic_writer = ElasticWriter(str(settings.elastic_dsn))
+    cache_invalidator = (
+        CacheInvalidator(str(settings.redis_dsn), channel=settings.cache_invalidation_channel)
+        if settings.redis_dsn
+        else None
+    )
 
     # Репозитории моделей для получения и обновления данных
     genre_repo = GenreRepository(pg_reader=pg_reader, elastic_writer=elastic_writer)
@@ -134,30 +162,41 @@ def main():
     filmwork_repo = FilmworkRepository(pg_reader=pg_reader, elastic_writer=elastic_writer)
 
     # Etl пайплайны для жанров, персонажей, фильмов
-    genre_etl = GenreEtl(repo=genre_repo, chunk_size=settings.chunk_size)
-    person_etl = PersonEtl(repo=person_repo, chunk_size=settings.chunk_size)
-    filmwork_etl = FilmworkEtl(repo=filmwork_repo, chunk_size=settings.chunk_size)
-
-    genre_pipeline = genre_etl.get_pipeline()
-    person_pipeline = person_etl.get_pipeline()
-    filmwork_pipeline = filmwork_etl.get_pipeline()
-
-    def last_timestamp_getter() -> datetime:
-        last_timestampt = state_storage.get_state("timestamp")
+    etl_options = dict(
+        chunk_size=settings.chunk_size,
+        cache_invalidator=cache_invalidator,
+        transform_concurrency=settings.transform_concurrency,
+        load_concurrency=settings.load_concurrency,
+        queue_size=settings.pipeline_queue_size,
+    )
+    genre_etl = GenreEtl(repo=genre_repo, **etl_options)
+    person_etl = PersonEtl(repo=person_repo, **etl_options)
+    filmwork_etl = FilmworkEtl(repo=filmwork_repo, **etl_options)
+
+    def last_timestamp_getter(etl_name: str) -> datetime:
+        last_timestampt = state_storage.get_state(f"{etl_name}_timestamp")
+        if not last_timestampt:
+            # Общее время синхронизации из состояния до разделения пайплайнов
+            last_timestampt = state_storage.get_state("timestamp")
         if last_timestampt:
             return datetime.fromisoformat(last_timestampt)
 
         return datetime.min
 
-    def last_timestamp_setter(timestamp: datetime):
-        state_storage.set_state("timestamp", timestamp.isoformat())
+    def last_timestamp_setter(etl_name: str, timestamp: datetime):
+        state_storage.set_state(f"{etl_name}_timestamp", timestamp.isoformat())
 
     # Корутина для запуска процесса ETL
-    beat_coro(
-        get_last_timestamp=last_timestamp_getter,
-        set_last_timestamp=last_timestamp_setter,
-        consumers_coro=[genre_pipeline, person_pipeline, filmwork_pipeline],
-    )
+    try:
+        asyncio.run(
+            beat(
+                get_last_timestamp=last_timestamp_getter,
+                set_last_timestamp=last_timestamp_setter,
+                etls=[genre_etl, person_etl, filmwork_etl],
+            )
+        )
+    finally:
+        pg_reader.close()
 
 
 if __name__ == "__main__":
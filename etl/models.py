@@ -6,16 +6,6 @@ PersonIDType = str
 GenreIDType = str
 
 
-@dataclass
-class FilmworkPerson:
-    id: str
-    full_name: str
-    role: Optional[str] = field(default=None)
-
-    def to_dict(self):
-        return asdict(self)
-
-
 @dataclass
 class Person:
     id: str
@@ -0,0 +1,83 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Callable, Generator, List, Optional
+
+# Маркер конца данных в очереди между этапами
+STOP = object()
+
+
+@dataclass
+class Stage:
+    """
+    Этап пайплайна: синхронная функция, которая выполняется в пуле потоков
+    в concurrency параллельных обработчиках
+    """
+
+    name: str
+    func: Callable[[Any], Any]
+    concurrency: int = 1
+
+
+async def run_pipeline(
+    source: Generator[Any, None, None], stages: List[Stage], queue_size: int = 2
+) -> None:
+    """
+    Запускает пайплайн: пачки из source передаются через этапы stages по очереди.
+    Между этапами - очереди на queue_size пачек, поэтому этапы работают одновременно
+    (следующая пачка читается из postgres, пока предыдущая записывается в elastic),
+    а быстрый этап не копит пачки в памяти, если следующий не успевает.
+    Источник читается в пуле потоков, так как чтение блокирующее.
+    Ошибка в любом этапе останавливает весь пайплайн и пробрасывается дальше.
+    После остановки источник закрывается: серверный курсор и соединение из пула,
+    которые он держит, освобождаются сразу, а не при сборке мусора.
+    """
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+    tasks = [asyncio.create_task(read_source(source, queues[0], stages[0].concurrency))]
+    for i, stage in enumerate(stages):
+        output = queues[i + 1] if i + 1 < len(stages) else None
+        next_concurrency = stages[i + 1].concurrency if output is not None else 0
+        tasks.append(asyncio.create_task(run_stage(stage, queues[i], output, next_concurrency)))
+
+    try:
+        for task in asyncio.as_completed(tasks):
+            await task
+    finally:
+        for task in tasks:
+            task.cancel()
+        # read_source при отмене дожидается потока чтения, поэтому источник уже не выполняется
+        await asyncio.gather(*tasks, return_exceptions=True)
+        source.close()
+
+
+async def read_source(
+    source: Generator[Any, None, None], output: asyncio.Queue, consumers: int
+) -> None:
+    while True:
+        read = asyncio.ensure_future(asyncio.to_thread(next, source, STOP))
+        try:
+            item = await asyncio.shield(read)
+        except asyncio.CancelledError:
+            # Поток нельзя прервать: ждем, пока он вернет пачку, иначе источник нельзя закрыть
+            await asyncio.gather(read, return_exceptions=True)
+            raise
+        if item is STOP:
+            break
+        await output.put(item)
+    for _ in range(consumers):
+        await output.put(STOP)
+
+
+async def run_stage(
+    stage: Stage, input: asyncio.Queue, output: Optional[asyncio.Queue], consumers: int
+) -> None:
+    """Обработчики этапа; после того как все они завершились, конец данных передается дальше"""
+
+    async def worker() -> None:
+        while (item := await input.get()) is not STOP:
+            result = await asyncio.to_thread(stage.func, item)
+            if output is not None:
+                await output.put(result)
+
+    await asyncio.gather(*(worker() for _ in range(stage.concurrency)))
+    for _ in range(consumers):
+        await output.put(STOP)
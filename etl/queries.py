@@ -5,8 +5,6 @@ SELECT fw_p.filmwork_id
     ON p.id = fw_p.person_id
  WHERE p.modified > {last_timestamp}
  ORDER BY p.modified ASC
-OFFSET {offset}
- LIMIT {limit}
 """
 
 
@@ -17,8 +15,6 @@ SELECT fw_g.filmwork_id
     ON g.id = fw_g.genre_id
  WHERE g.modified > {last_timestamp}
  ORDER BY g.modified ASC
-OFFSET {offset}
- LIMIT {limit}
 """
 
 
@@ -27,8 +23,6 @@ SELECT id
   FROM movies_filmwork
  WHERE modified > {last_timestamp}
  ORDER BY modified ASC
-OFFSET {offset}
- LIMIT {limit}
 """
 
 
@@ -38,42 +32,39 @@ SELECT fw.id,
        fw.title,
        fw.description,
        fw.rating,
-       array_agg(g.name)
+       COALESCE(fw_genres.genres, '[]'),
+       COALESCE(fw_persons.directors, '[]'),
+       COALESCE(fw_persons.writers, '[]'),
+       COALESCE(fw_persons.actors, '[]')
   FROM movies_filmwork fw
-  LEFT JOIN movies_filmwork_genres fw_g
-    ON fw.id = fw_g.filmwork_id
-  LEFT JOIN movies_genre g
-    ON fw_g.genre_id = g.id
+  LEFT JOIN LATERAL (
+       SELECT json_agg(json_build_object('id', g.id, 'name', g.name)) AS genres
+         FROM movies_genre g
+         JOIN movies_filmwork_genres fw_g
+           ON g.id = fw_g.genre_id
+        WHERE fw_g.filmwork_id = fw.id
+       ) fw_genres ON true
+  LEFT JOIN LATERAL (
+       SELECT json_agg(person) FILTER (WHERE role = 'director') AS directors,
+              json_agg(person) FILTER (WHERE role = 'writer') AS writers,
+              json_agg(person) FILTER (WHERE role = 'actor') AS actors
+         FROM (
+              SELECT fw_p.role,
+                     json_build_object(
+                         'id', p.id,
+                         'full_name', p.first_name || ' ' || p.last_name
+                     ) AS person
+                FROM movies_person p
+                JOIN movies_filmwork_participants fw_p
+                  ON p.id = fw_p.person_id
+               WHERE fw_p.filmwork_id = fw.id
+              ) participants
+       ) fw_persons ON true
  WHERE fw.id in ({filmworks_ids})
- GROUP BY fw.id
  ORDER BY fw.modified ASC
 """
 
 
-select_filmworks_participants_query = """
-SELECT fw_p.filmwork_id,
-       p.id,
-       p.first_name,
-       p.last_name,
-       fw_p.role
-  FROM movies_person p
-  JOIN movies_filmwork_participants fw_p
-    ON p.id = fw_p.person_id
- WHERE fw_p.filmwork_id in ({filmworks_ids})
-"""
-
-
-select_filmworks_genres_query = """
-SELECT fw_g.filmwork_id,
-       g.id,
-       g.name
-  FROM movies_genre g
-  JOIN movies_filmwork_genres fw_g
-    ON g.id = fw_g.genre_id
- WHERE fw_g.filmwork_id in ({filmworks_ids})
-"""
-
-
 select_modified_persons = """
 SELECT id,
        first_name,
@@ -81,8 +72,6 @@ SELECT id,
   FROM movies_person
  WHERE modified > {last_timestamp}
  ORDER BY modified ASC
-OFFSET {offset}
- LIMIT {limit}
 """
 
 
@@ -92,6 +81,4 @@ SELECT id,
   FROM movies_genre
  WHERE modified > {last_timestamp}
  ORDER BY modified ASC
-OFFSET {offset}
- LIMIT {limit}
 """
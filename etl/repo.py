@@ -1,13 +1,12 @@
 from abc import ABC, abstractmethod
-from collections import defaultdict
 from datetime import datetime
 from itertools import chain
-from typing import Any, Dict, Iterator, List, Set
+from typing import Any, Generator, List, Set
 
 from storage import ElasticWriter, PGReader
 from utils import logger
 
-from models import Filmwork, FilmworkIDType, FilmworkPerson, Genre, Person
+from models import Filmwork, FilmworkIDType, Genre, Person
 
 
 class BaseRepository(ABC):
@@ -15,6 +14,8 @@ class BaseRepository(ABC):
     Базовый класс для описания запросов к postgres, elastic в рамках конкретной модели данных
     """
 
+    index_name: str = ""
+
     def __init__(self, pg_reader: PGReader, elastic_writer: ElasticWriter):
         self.pg_reader = pg_reader
         self.elastic_writer = elastic_writer
@@ -22,7 +23,7 @@ class BaseRepository(ABC):
     @abstractmethod
     def get_modified_items(
         self, last_timestamp: datetime, chunk_size: int = 100
-    ) -> Iterator[List[Any]]:
+    ) -> Generator[List[Any], None, None]:
         """
         Метод для получения данных, обновленных после last_timestamp
         """
@@ -35,19 +36,25 @@ class BaseRepository(ABC):
         """
         pass
 
+    def get_related_ids(self, items: List[Any]) -> List[str]:
+        """
+        Метод для получения id всех сущностей, данные которых изменились вместе с документами
+        """
+        return [item.id for item in items]
+
 
 class GenreRepository(BaseRepository):
+    index_name = "genres"
+
     def get_modified_items(
         self, last_timestamp: datetime, chunk_size: int = 100
-    ) -> Iterator[List[Genre]]:
-        offset = 0
-        while items := self.pg_reader.read_modified_genres(last_timestamp, offset, chunk_size):
-            offset += len(items)
+    ) -> Generator[List[Genre], None, None]:
+        for items in self.pg_reader.read_modified_genres(last_timestamp, chunk_size):
             yield [Genre(id=genre_id, name=name) for genre_id, name in items]
 
     def update_items_index(self, items: List[Genre]) -> None:
         result = self.elastic_writer.bulk_create_or_update(
-            index_name="genres", items=[(i.id, i.to_dict()) for i in items]
+            index_name=self.index_name, items=[(i.id, i.to_dict()) for i in items]
         )
         for item_id, error in result:
             if error:
@@ -57,12 +64,12 @@ class GenreRepository(BaseRepository):
 
 
 class PersonRepository(BaseRepository):
+    index_name = "persons"
+
     def get_modified_items(
         self, last_timestamp: datetime, chunk_size: int = 100
-    ) -> Iterator[List[Person]]:
-        offset = 0
-        while items := self.pg_reader.read_modified_persons(last_timestamp, offset, chunk_size):
-            offset += len(items)
+    ) -> Generator[List[Person], None, None]:
+        for items in self.pg_reader.read_modified_persons(last_timestamp, chunk_size):
             yield [
                 Person(id=person_id, full_name=f"{first_name} {last_name}")
                 for person_id, first_name, last_name in items
@@ -70,7 +77,7 @@ class PersonRepository(BaseRepository):
 
     def update_items_index(self, items: List[Person]) -> None:
         result = self.elastic_writer.bulk_create_or_update(
-            index_name="persons", items=[(i.id, i.to_dict()) for i in items]
+            index_name=self.index_name, items=[(i.id, i.to_dict()) for i in items]
         )
         for item_id, error in result:
             if error:
@@ -80,9 +87,11 @@ class PersonRepository(BaseRepository):
 
 
 class FilmworkRepository(BaseRepository):
+    index_name = "movies"
+
     def get_modified_items(
         self, last_timestamp: datetime, chunk_size: int = 100
-    ) -> Iterator[List[Filmwork]]:
+    ) -> Generator[List[Filmwork], None, None]:
         """
         Получение списка обновленных фильмов. id обновленных фильмов собираются из 3 источников:
         1. Непосредственно обновленные фильмы
@@ -96,9 +105,9 @@ class FilmworkRepository(BaseRepository):
         chunk_filmwork_ids: List[FilmworkIDType] = []
 
         for possible_filmwork_ids in chain(
-            self._get_modified_filmworks(last_timestamp, limit=chunk_size),
-            self._get_modified_filmworks_from_genres(last_timestamp, limit=chunk_size),
-            self._get_modified_filmworks_from_persons(last_timestamp, limit=chunk_size),
+            self.pg_reader.read_modified_filmworks(last_timestamp, chunk_size),
+            self.pg_reader.read_modified_filmworks_from_genres(last_timestamp, chunk_size),
+            self.pg_reader.read_modified_filmworks_from_persons(last_timestamp, chunk_size),
         ):
             for filmwork_id in possible_filmwork_ids:
                 if filmwork_id in unique_ids:
@@ -114,39 +123,22 @@ class FilmworkRepository(BaseRepository):
         if chunk_filmwork_ids:
             yield self.get_filmworks(chunk_filmwork_ids)
 
-    def _get_modified_filmworks(
-        self, last_timestamp: datetime, limit: int
-    ) -> Iterator[List[FilmworkIDType]]:
-        offset = 0
-        while filmwork_ids := self.pg_reader.read_modified_filmworks(last_timestamp, offset, limit):
-            offset += len(filmwork_ids)
-            yield filmwork_ids
-
-    def _get_modified_filmworks_from_genres(
-        self, last_timestamp: datetime, limit: int
-    ) -> Iterator[List[FilmworkIDType]]:
-        offset = 0
-        while filmwork_ids := self.pg_reader.read_modified_filmworks_from_genres(
-            last_timestamp, offset, limit
-        ):
-            offset += len(filmwork_ids)
-            yield filmwork_ids
-
-    def _get_modified_filmworks_from_persons(
-        self, last_timestamp: datetime, limit: int
-    ) -> Iterator[List[FilmworkIDType]]:
-        offset = 0
-        while filmwork_ids := self.pg_reader.read_modified_filmworks_from_persons(
-            last_timestamp, offset, limit
-        ):
-            offset += len(filmwork_ids)
-            yield filmwork_ids
-
     def get_filmworks(self, filmworks_ids: List[FilmworkIDType]) -> List[Filmwork]:
+        """
+        Получение документов фильмов с жанрами и участниками
+        """
         filmworks = []
-        for id, filmwork_type, title, description, rating, genres in self.pg_reader.read_filmworks(
-            filmworks_ids
-        ):
+        for (
+            id,
+            filmwork_type,
+            title,
+            description,
+            rating,
+            genres,
+            directors,
+            writers,
+            actors,
+        ) in self.pg_reader.read_filmworks(filmworks_ids):
             filmworks.append(
                 Filmwork(
                     id=id,
@@ -154,43 +146,29 @@ class FilmworkRepository(BaseRepository):
                     title=title,
                     description=description,
                     imdb_rating=rating,
+                    genres=[Genre(**genre) for genre in genres],
+                    directors=directors,
+                    writers=writers,
+                    actors=actors,
                 )
             )
         return filmworks
 
-    def get_filmworks_participants(
-        self, filmworks_ids: List[FilmworkIDType]
-    ) -> Dict[FilmworkIDType, List[FilmworkPerson]]:
-        """
-        Получение участников фильмов
-        """
-        filmworks_to_participans_map: Dict[FilmworkIDType, FilmworkPerson] = defaultdict(list)
-        for (
-            filmwork_id,
-            person_id,
-            first_name,
-            last_name,
-            role,
-        ) in self.pg_reader.read_filmworks_participants(filmworks_ids):
-            filmworks_to_participans_map[filmwork_id].append(
-                FilmworkPerson(id=person_id, full_name=f"{first_name} {last_name}", role=role)
-            )
-        return filmworks_to_participans_map
-
-    def get_filmworks_genres(
-        self, filmworks_ids: List[FilmworkIDType]
-    ) -> Dict[FilmworkIDType, List[Genre]]:
+    def get_related_ids(self, items: List[Filmwork]) -> List[str]:
         """
-        Получение жанров фильмов
+        Кроме самих фильмов в ответах api меняются данные их жанров и участников
         """
-        filmworks_to_genres_map: Dict[FilmworkIDType, Genre] = defaultdict(list)
-        for (filmwork_id, genre_id, name) in self.pg_reader.read_filmworks_genres(filmworks_ids):
-            filmworks_to_genres_map[filmwork_id].append(Genre(id=genre_id, name=name))
-        return filmworks_to_genres_map
+        related_ids = set()
+        for filmwork in items:
+            related_ids.add(filmwork.id)
+            related_ids.update(genre.id for genre in filmwork.genres)
+            for person in chain(filmwork.actors, filmwork.writers, filmwork.directors):
+                related_ids.add(person["id"])
+        return list(related_ids)
 
     def update_items_index(self, items: List[Filmwork]) -> None:
         result = self.elastic_writer.bulk_create_or_update(
-            index_name="movies", items=[(i.id, i.to_dict()) for i in items]
+            index_name=self.index_name, items=[(i.id, i.to_dict()) for i in items]
         )
         for item_id, error in result:
             if error:
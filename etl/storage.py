@@ -1,16 +1,19 @@
 import abc
 import json
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 from functools import partialmethod
 from pathlib import Path
-from typing import Any, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import uuid4
 
 import psycopg2
+import redis
 import requests
-from psycopg2 import sql
+from psycopg2 import pool, sql
 from queries import (
-    select_filmworks_genres_query,
-    select_filmworks_participants_query,
     select_filmworks_query,
     select_modified_filmworks,
     select_modified_filmworks_from_genres,
@@ -24,45 +27,147 @@ from models import FilmworkIDType, GenreIDType, PersonIDType
 
 
 def is_db_reader_connection_error(e: Exception):
-    return isinstance(e, psycopg2.OperationalError) and "Connection refused" in str(e)
+    # OperationalError - postgres недоступен или разорвал соединение,
+    # InterfaceError - соединение уже закрыто, PoolError - все соединения пула заняты
+    return isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError, pool.PoolError))
 
 
 def is_writer_connection_error(e: Exception):
     return isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
 
 
+def is_publisher_connection_error(e: Exception):
+    return isinstance(e, (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError))
+
+
 class PGReader:
     """
-    Класс для чтения данных из postgres
+    Класс для чтения данных из postgres.
+    Соединения берутся из пула и переиспользуются между запросами.
+    Соединение, простаивавшее дольше health_check_interval секунд, перед запросом проверяется,
+    а соединение, на котором произошла ошибка подключения, закрывается и убирается из пула,
+    поэтому повтор запроса в backoff выполняется на новом соединении.
     """
 
-    def __init__(self, postgres_dsn: str):
+    def __init__(
+        self,
+        postgres_dsn: str,
+        min_connections: int = 1,
+        max_connections: int = 10,
+        health_check_interval: float = 30,
+    ):
         self.postgres_dsn = postgres_dsn
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.health_check_interval = health_check_interval
+        # Пул создается при первом запросе, чтобы ошибки подключения обрабатывал backoff
+        self.pool: Optional[pool.ThreadedConnectionPool] = None
+        # Пайплайны читают postgres из разных потоков, пул должен быть создан только один раз
+        self.pool_lock = threading.Lock()
+        # Время последнего использования соединений по id соединения
+        self.last_used: Dict[int, float] = {}
 
     @backoff(
         on_predicate=is_db_reader_connection_error,
         border_sleep_time=60,
     )
     def read(self, query):
-        with psycopg2.connect(self.postgres_dsn) as conn:
+        with self.connection() as conn:
             with conn.cursor() as cursor:
                 cursor.execute(query)
                 return cursor.fetchall()
 
+    def read_chunks(self, query, chunk_size: int) -> Iterator[List[tuple]]:
+        """
+        Чтение результата запроса пачками по chunk_size через именованный (серверный) курсор.
+        Запрос выполняется один раз, строки передаются с сервера по мере чтения,
+        поэтому время чтения растет линейно с количеством строк.
+        Соединение занято, пока результат не прочитан до конца.
+        """
+        with self.connection() as conn:
+            with conn.cursor(name=f"etl_{uuid4().hex}") as cursor:
+                cursor.itersize = chunk_size
+                cursor.execute(query)
+                while rows := cursor.fetchmany(chunk_size):
+                    yield rows
+
+    @contextmanager
+    def connection(self) -> Iterator[psycopg2.extensions.connection]:
+        """
+        Соединение из пула в транзакции: после блока транзакция завершается,
+        а соединение возвращается в пул. Сломанное соединение закрывается
+        """
+        conn = self.get_connection()
+        broken = False
+        try:
+            with conn:
+                yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.put_connection(conn, broken=broken)
+
+    @backoff(
+        on_predicate=is_db_reader_connection_error,
+        border_sleep_time=60,
+    )
+    def get_connection(self) -> psycopg2.extensions.connection:
+        """Рабочее соединение из пула, пул создается при первом запросе"""
+        if self.pool is None:
+            with self.pool_lock:
+                if self.pool is None:
+                    self.pool = pool.ThreadedConnectionPool(
+                        self.min_connections, self.max_connections, self.postgres_dsn
+                    )
+
+        conn = self.pool.getconn()
+        try:
+            self.check_connection(conn)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.put_connection(conn, broken=True)
+            raise
+        return conn
+
+    def put_connection(self, conn: psycopg2.extensions.connection, broken: bool = False) -> None:
+        broken = broken or bool(conn.closed)
+        if broken:
+            self.last_used.pop(id(conn), None)
+        else:
+            self.last_used[id(conn)] = time.monotonic()
+        self.pool.putconn(conn, close=broken)
+
+    def check_connection(self, conn: psycopg2.extensions.connection) -> None:
+        """Проверяет соединение, которое долго не использовалось и могло быть разорвано"""
+        if conn.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+
+        last_used = self.last_used.get(id(conn))
+        if last_used is not None and time.monotonic() - last_used < self.health_check_interval:
+            return
+
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+
+    def close(self) -> None:
+        with self.pool_lock:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
+                self.last_used.clear()
+
     def read_modified_filmworks_by_query(
-        self, query: str, last_timestamp: datetime, offset: int, limit: int
-    ) -> List[str]:
+        self, query: str, last_timestamp: datetime, chunk_size: int
+    ) -> Iterator[List[FilmworkIDType]]:
         """
-        Получение id фильмов, обновленных после last_timestamp
+        Получение id фильмов, обновленных после last_timestamp, пачками по chunk_size
         """
-        result = self.read(
-            sql.SQL(query).format(
-                last_timestamp=sql.Literal(last_timestamp.isoformat()),
-                offset=sql.Literal(offset),
-                limit=sql.Literal(limit),
-            )
-        )
-        return [t[0] for t in result]
+        for rows in self.read_chunks(
+            sql.SQL(query).format(last_timestamp=sql.Literal(last_timestamp.isoformat())),
+            chunk_size=chunk_size,
+        ):
+            yield [t[0] for t in rows]
 
     read_modified_filmworks_from_persons = partialmethod(
         read_modified_filmworks_by_query, select_modified_filmworks_from_persons
@@ -76,57 +181,38 @@ class PGReader:
 
     def read_filmworks(self, filmworks_ids: List[FilmworkIDType]):
         """
-        Получение фильмов по списку id
+        Получение фильмов по списку id вместе с жанрами и участниками по ролям
+        одним запросом: жанры и участники собираются в json на стороне postgres
         """
         query = sql.SQL(select_filmworks_query).format(
             filmworks_ids=sql.SQL(",").join(sql.Literal(fw_id) for fw_id in filmworks_ids)
         )
         return self.read(query)
 
-    def read_filmworks_participants(self, filmworks_ids: List[FilmworkIDType]):
-        """
-        Получение участников фильмов по списку id фильмов
-        """
-        query = sql.SQL(select_filmworks_participants_query).format(
-            filmworks_ids=sql.SQL(",").join(sql.Literal(fw_id) for fw_id in filmworks_ids)
-        )
-        return self.read(query)
-
-    def read_filmworks_genres(self, filmworks_ids: List[FilmworkIDType]):
-        """
-        Получение жанров по списку id фильмов
-        """
-        query = sql.SQL(select_filmworks_genres_query).format(
-            filmworks_ids=sql.SQL(",").join(sql.Literal(fw_id) for fw_id in filmworks_ids)
-        )
-        return self.read(query)
-
     def read_modified_persons(
-        self, last_timestamp: datetime, offset: int, limit: int
-    ) -> List[Tuple[PersonIDType, str, str]]:
+        self, last_timestamp: datetime, chunk_size: int
+    ) -> Iterator[List[Tuple[PersonIDType, str, str]]]:
         """
-        Получения данных о персонах, обновленных после last_timestamp
+        Получения данных о персонах, обновленных после last_timestamp, пачками по chunk_size
         """
-        return self.read(
+        return self.read_chunks(
             sql.SQL(select_modified_persons).format(
-                last_timestamp=sql.Literal(last_timestamp.isoformat()),
-                offset=sql.Literal(offset),
-                limit=sql.Literal(limit),
-            )
+                last_timestamp=sql.Literal(last_timestamp.isoformat())
+            ),
+            chunk_size=chunk_size,
         )
 
     def read_modified_genres(
-        self, last_timestamp: datetime, offset: int, limit: int
-    ) -> List[Tuple[GenreIDType, str]]:
+        self, last_timestamp: datetime, chunk_size: int
+    ) -> Iterator[List[Tuple[GenreIDType, str]]]:
         """
-        Получения данных о жанрах, обновленных после last_timestamp
+        Получения данных о жанрах, обновленных после last_timestamp, пачками по chunk_size
         """
-        return self.read(
+        return self.read_chunks(
             sql.SQL(select_modified_genres).format(
-                last_timestamp=sql.Literal(last_timestamp.isoformat()),
-                offset=sql.Literal(offset),
-                limit=sql.Literal(limit),
-            )
+                last_timestamp=sql.Literal(last_timestamp.isoformat())
+            ),
+            chunk_size=chunk_size,
         )
 
 
@@ -137,8 +223,17 @@ class ElasticWriter:
 
     def __init__(self, elastic_url: str):
         self.elastic_url = elastic_url
-        self.session = requests.Session()
-        self.session.headers["Content-Type"] = "application/json"
+        # Запись идет из потоков пайплайнов, а requests.Session не потокобезопасна,
+        # поэтому у каждого потока своя сессия
+        self.local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self.local, "session", None)
+        if session is None:
+            session = self.local.session = requests.Session()
+            session.headers["Content-Type"] = "application/json"
+        return session
 
     @backoff(
         on_predicate=is_writer_connection_error,
@@ -149,6 +244,18 @@ class ElasticWriter:
         response.raise_for_status()
         return response.json()
 
+    def bulk(self, data: List[str]) -> dict:
+        """
+        Запрос _bulk. Ответ возвращается после того, как изменения стали видны в поиске,
+        иначе api по событию сброса кеша успел бы закешировать заново старые данные
+        """
+        return self.write(
+            "PUT",
+            f"{self.elastic_url}/_bulk",
+            params={"refresh": "wait_for"},
+            data="\n".join(data) + "\n",
+        )
+
     def bulk_create(
         self, index_name: str, items: List[Tuple[str, Any]]
     ) -> List[Tuple[str, Optional[str]]]:
@@ -160,7 +267,7 @@ class ElasticWriter:
             data.append(json.dumps({"create": {"_index": index_name, "_id": item_id}}))
             data.append(json.dumps(item))
 
-        response = self.write("PUT", f"{self.elastic_url}/_bulk", data="\n".join(data) + "\n")
+        response = self.bulk(data)
 
         errors_map = {}
         for item_error in response["items"]:
@@ -188,7 +295,7 @@ class ElasticWriter:
             data.append(json.dumps({"update": {"_index": index_name, "_id": item_id}}))
             data.append(json.dumps({"doc": item}))
 
-        response = self.write("PUT", f"{self.elastic_url}/_bulk", data="\n".join(data) + "\n")
+        response = self.bulk(data)
 
         errors_map = {}
         for item_error in response["items"]:
@@ -234,6 +341,24 @@ class ElasticWriter:
         return [(item_id, errors_map.get(item_id)) for item_id, _ in items]
 
 
+class CacheInvalidator:
+    """
+    Класс для публикации в redis событий об изменении документов.
+    По этим событиям api сбрасывает закешированные ответы с измененными документами.
+    """
+
+    def __init__(self, redis_dsn: str, channel: str):
+        self.redis = redis.Redis.from_url(redis_dsn)
+        self.channel = channel
+
+    @backoff(
+        on_predicate=is_publisher_connection_error,
+        border_sleep_time=60,
+    )
+    def invalidate(self, index_name: str, ids: List[str]) -> None:
+        self.redis.publish(self.channel, json.dumps({"index": index_name, "ids": ids}))
+
+
 class BaseStorage:
     @abc.abstractmethod
     def save_state(self, state: dict) -> None:
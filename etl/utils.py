@@ -16,16 +16,6 @@ def get_logger(name):
     return logging.getLogger(f"etl.{name}")
 
 
-def coroutine(func):
-    @wraps(func)
-    def inner(*args, **kwargs):
-        fn = func(*args, **kwargs)
-        next(fn)
-        return fn
-
-    return inner
-
-
 def backoff(
     on_predicate: Callable[[Exception], bool],
     start_sleep_time: float = 0.1,
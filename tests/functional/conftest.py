@@ -83,12 +83,15 @@ async def http_session():
 
 @pytest.fixture(scope="session")
 def make_get_request(settings: Settings, http_session: aiohttp.ClientSession):
-    async def inner(prefix: str, method: str, params: dict = None) -> HTTPResponse:
+    async def inner(
+        prefix: str, method: str, params: dict = None, headers: dict = None
+    ) -> HTTPResponse:
         params = params or {}
         url = "".join((str(settings.api_url), prefix, method))
-        async with http_session.get(url, params=params) as response:
+        async with http_session.get(url, params=params, headers=headers) as response:
             return HTTPResponse(
-                body=await response.json(),
+                # Ответ 304 приходит без тела и типа содержимого
+                body=await response.json(content_type=None),
                 headers=response.headers,
                 status=response.status,
             )
@@ -1,3 +1,4 @@
+import base64
 import json
 from functools import partial
 from pathlib import Path
@@ -275,3 +276,55 @@ async def test_search_film_page_number(make_film_request, title: str, page: int,
     )
     assert response.status == 200
     assert all_films_search.body[size * (page - 1) : (size * page)] == response.body
+
+
+@pytest.mark.parametrize(
+    "film_ids",
+    [
+        ["b05e03d9-3e7e-4233-ba9b-f81e417fc4b3"],
+        ["9c472cfa-7d31-4d6c-868f-274e8f40fa27", "b05e03d9-3e7e-4233-ba9b-f81e417fc4b3"],
+        [
+            "4d469eef-1635-4f8d-9ec5-be85cc5c3c2d",
+            "219710f5-1d2c-4edc-855b-c98d675305b8",
+            "9c472cfa-7d31-4d6c-868f-274e8f40fa27",
+        ],
+    ],
+)
+@pytest.mark.asyncio
+async def test_film_batch(make_film_request, film_ids: List[str]):
+    """Тест получения фильмов по списку id"""
+    expected_body = []
+    for film_id in film_ids:
+        response = await make_film_request(method=f"/{film_id}/")
+        if response.status == 200:
+            expected_body.append(response.body)
+
+    response = await make_film_request(
+        method="/batch/", params=[("ids", film_id) for film_id in film_ids]
+    )
+    assert response.status == 200
+    assert response.body == expected_body
+
+
+@pytest.mark.asyncio
+async def test_film_batch_too_many_ids(make_film_request):
+    """Тест ограничения количества id в запросе"""
+    params = [("ids", "b05e03d9-3e7e-4233-ba9b-f81e417fc4b3")] * 101
+    response = await make_film_request(method="/batch/", params=params)
+    assert response.status == 422
+
+
+@pytest.mark.parametrize(
+    "cursor_values",
+    [
+        ["not-a-rating", "b05e03d9-3e7e-4233-ba9b-f81e417fc4b3"],
+        [{"imdb_rating": 8.6}, "b05e03d9-3e7e-4233-ba9b-f81e417fc4b3"],
+    ],
+)
+@pytest.mark.asyncio
+async def test_film_list_tampered_cursor(make_film_request, cursor_values: List):
+    """Тест курсора со значениями, не подходящими к полям сортировки"""
+    cursor = base64.urlsafe_b64encode(json.dumps(cursor_values).encode()).decode()
+    response = await make_film_request(method="/", params={"page[cursor]": cursor})
+    assert response.status == 400
+    assert response.body == {"detail": "invalid cursor"}
@@ -147,6 +147,31 @@ async def test_genre_list_page_number(make_genre_request, page: int, size: int):
     assert all_genres.body[size * (page - 1) : (size * page)] == response.body
 
 
+@pytest.mark.parametrize("size", [1, 3, 7])
+@pytest.mark.asyncio
+async def test_genre_list_cursor(make_genre_request, size: int):
+    """Тест пагинации списка жанров по курсору"""
+    all_genres = await make_genre_request(method="/")
+
+    genres, cursor = [], ""
+    while cursor is not None:
+        response = await make_genre_request(method="/", params={"size": size, "cursor": cursor})
+        assert response.status == 200
+        assert len(response.body) <= size
+        genres.extend(response.body)
+        cursor = response.headers.get("X-Next-Cursor")
+
+    assert genres == all_genres.body
+
+
+@pytest.mark.asyncio
+async def test_genre_list_invalid_cursor(make_genre_request):
+    """Тест некорректного курсора"""
+    response = await make_genre_request(method="/", params={"cursor": "invalid"})
+    assert response.status == 400
+    assert response.body == {"detail": "invalid cursor"}
+
+
 @pytest.mark.parametrize("sort_field", ["id", "name"])
 @pytest.mark.asyncio
 async def test_genre_list_sort_asc(make_genre_request, sort_field: str):
@@ -173,7 +198,7 @@ async def test_genre_list_sort_desc(make_genre_request, sort_field: str):
 
 @pytest.mark.asyncio
 async def test_genre_list_cache(make_genre_request, redis_client):
-    expected_key = "/api/v1/genre/size=5&sort=name"
+    expected_key = "/api/v1/genre/?page=1&size=5&sort=name"
     expected_body = [
         {"id": "a4d63486-7447-46df-98cc-55735180941a", "name": "Action"},
         {"id": "41062d8b-1f6d-4fc6-adf7-fc3412bafc47", "name": "Adventure"},
@@ -184,10 +209,46 @@ async def test_genre_list_cache(make_genre_request, redis_client):
 
     assert await redis_client.get(expected_key) is None
 
-    response = await make_genre_request(method="/", params={"size": 5, "sort": "name"})
+    response = await make_genre_request(method="/", params={"sort": "name", "size": 5})
     assert response.status == 200
     assert response.body == expected_body
 
     cached_response = await redis_client.get(expected_key)
     assert cached_response is not None
-    assert json.loads(cached_response) == expected_body
+    _, cached_body = cached_response.split(b"\r\n\r\n", 1)
+    assert json.loads(cached_body) == expected_body
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"size": 5, "sort": "name"},
+        {"page": 1, "size": 5, "sort": "name"},
+        {"size": 5, "sort": "name", "unknown": "param"},
+    ],
+)
+@pytest.mark.asyncio
+async def test_genre_list_cache_key(make_genre_request, redis_client, params: Dict):
+    """Тест общего ключа кеша для эквивалентных запросов"""
+    response = await make_genre_request(method="/", params=params)
+    assert response.status == 200
+    assert await redis_client.keys("/api/v1/genre/*") == [b"/api/v1/genre/?page=1&size=5&sort=name"]
+
+
+@pytest.mark.asyncio
+async def test_genre_detail_not_modified(make_genre_request):
+    """Тест условного запроса с If-None-Match"""
+    method = "/a4d63486-7447-46df-98cc-55735180941a/"
+    response = await make_genre_request(method=method)
+    assert response.status == 200
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "no-cache"
+
+    response = await make_genre_request(method=method, headers={"If-None-Match": etag})
+    assert response.status == 304
+    assert response.headers["ETag"] == etag
+    assert response.body is None
+
+    response = await make_genre_request(method=method, headers={"If-None-Match": '"other"'})
+    assert response.status == 200
+    assert response.headers["ETag"] == etag
@@ -6,6 +6,18 @@ import pytest
 
 PERSON_PREFIX = "/api/v1/person"
 
+PROLIFIC_PERSON_ID = "5a3f9c1e-2b4d-4e6f-8a7b-9c0d1e2f3a4b"
+# Больше двух пачек, которыми api читает фильмы персоны (PERSON_FILMS_CHUNK_SIZE = 500)
+PROLIFIC_PERSON_FILMS_COUNT = 1001
+
+WRITER_PERSON = {"id": "7d1e4b2a-9c3f-4a5e-8b6d-0f1a2b3c4d5e", "full_name": "Quentin Writerson"}
+# Фильмы персоны по возрастанию id: сначала она сценарист, затем режиссер, затем актер
+WRITER_PERSON_FILMS = {
+    "writer": "10000000-0000-4000-8000-000000000001",
+    "director": "10000000-0000-4000-8000-000000000002",
+    "actor": "10000000-0000-4000-8000-000000000003",
+}
+
 
 @pytest.fixture(scope="session")
 async def make_person_request(make_get_request):
@@ -90,6 +102,75 @@ async def film_data(es_client):
     await es_client.delete_by_query(index="movies", body={"query": {"match_all": {}}}, refresh=True)
 
 
+@pytest.fixture
+async def prolific_person_data(es_client):
+    """Персона, фильмы которой не помещаются в одну пачку потокового чтения фильмов api"""
+    person = {"id": PROLIFIC_PERSON_ID, "full_name": "Prolific Actor"}
+    films = [
+        {
+            "id": f"00000000-0000-4000-8000-{i:012d}",
+            "title": f"Film {i}",
+            "imdb_rating": 5.0,
+            "description": "description",
+            "genres": [],
+            "actors": [person],
+            "writers": [],
+            "directors": [],
+        }
+        for i in range(PROLIFIC_PERSON_FILMS_COUNT)
+    ]
+
+    body = [json.dumps({"create": {"_index": "persons", "_id": person["id"]}}), json.dumps(person)]
+    for film in films:
+        body.append(json.dumps({"create": {"_index": "movies", "_id": film["id"]}}))
+        body.append(json.dumps(film))
+
+    await es_client.bulk(body=body, refresh=True)
+    yield films
+    await es_client.delete(index="persons", id=person["id"], refresh=True)
+    await es_client.delete_by_query(
+        index="movies",
+        body={"query": {"ids": {"values": [film["id"] for film in films]}}},
+        refresh=True,
+    )
+
+
+@pytest.fixture
+async def writer_person_data(es_client):
+    """Персона, роли которой встречаются в фильмах не в порядке RoleType"""
+    films = [
+        {
+            "id": film_id,
+            "title": f"Film as {role}",
+            "imdb_rating": 5.0,
+            "description": "description",
+            "genres": [],
+            "actors": [],
+            "writers": [],
+            "directors": [],
+            f"{role}s": [WRITER_PERSON],
+        }
+        for role, film_id in WRITER_PERSON_FILMS.items()
+    ]
+
+    body = [
+        json.dumps({"create": {"_index": "persons", "_id": WRITER_PERSON["id"]}}),
+        json.dumps(WRITER_PERSON),
+    ]
+    for film in films:
+        body.append(json.dumps({"create": {"_index": "movies", "_id": film["id"]}}))
+        body.append(json.dumps(film))
+
+    await es_client.bulk(body=body, refresh=True)
+    yield
+    await es_client.delete(index="persons", id=WRITER_PERSON["id"], refresh=True)
+    await es_client.delete_by_query(
+        index="movies",
+        body={"query": {"ids": {"values": list(WRITER_PERSON_FILMS.values())}}},
+        refresh=True,
+    )
+
+
 @pytest.mark.parametrize(
     "method, expected_status_code",
     [
@@ -243,6 +324,40 @@ async def test_person_film_list(
     assert response.body == expected_body
 
 
+@pytest.mark.asyncio
+async def test_person_filmography_spans_chunks(make_person_request, prolific_person_data):
+    """Тест фильмографии персоны, которая читается из хранилища несколькими пачками"""
+    film_ids = sorted(film["id"] for film in prolific_person_data)
+
+    response = await make_person_request(method=f"/{PROLIFIC_PERSON_ID}/")
+    assert response.status == 200
+    assert response.body["roles"] == ["actor"]
+    assert response.body["film_ids"] == film_ids
+
+    response = await make_person_request(method=f"/{PROLIFIC_PERSON_ID}/film/")
+    assert response.status == 200
+    assert sorted(film["id"] for film in response.body) == film_ids
+    assert all(film["roles"] == ["actor"] for film in response.body)
+
+
+@pytest.mark.asyncio
+async def test_person_roles_order(make_person_request, writer_person_data):
+    """Тест порядка ролей персоны: роли идут в порядке RoleType, а не в порядке фильмов"""
+    response = await make_person_request(method=f"/{WRITER_PERSON['id']}/")
+    assert response.status == 200
+    assert response.body == {
+        **WRITER_PERSON,
+        "roles": ["actor", "director", "writer"],
+        "film_ids": sorted(WRITER_PERSON_FILMS.values()),
+    }
+
+    response = await make_person_request(method=f"/{WRITER_PERSON['id']}/film/")
+    assert response.status == 200
+    assert {film["id"]: film["roles"] for film in response.body} == {
+        film_id: [role] for role, film_id in WRITER_PERSON_FILMS.items()
+    }
+
+
 @pytest.mark.parametrize(
     "person_full_name, expected_status_code, expected_body",
     [
@@ -317,6 +432,22 @@ async def test_search_person(
     assert response.body == expected_body
 
 
+@pytest.mark.asyncio
+async def test_search_person_roles_order(make_person_request, writer_person_data):
+    """Тест порядка ролей в поиске персон совпадает с детальной информацией о персоне"""
+    response = await make_person_request(
+        method="/search/", params={"query": WRITER_PERSON["full_name"]}
+    )
+    assert response.status == 200
+    assert response.body == [
+        {
+            **WRITER_PERSON,
+            "roles": ["actor", "director", "writer"],
+            "film_ids": sorted(WRITER_PERSON_FILMS.values()),
+        }
+    ]
+
+
 @pytest.mark.parametrize(
     "person_full_name, size", [("Harrison Ford", size) for size in range(1, 9)]
 )
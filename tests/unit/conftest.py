@@ -0,0 +1,109 @@
+import asyncio
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+from main import CACHE_PATH_TAGS, app
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core import config
+from core.middleware import CacheMiddleware
+from db import memory
+from db.lru import LRUCacheStorage
+
+TESTDATA_DIR = Path(__file__).resolve().parents[1] / "functional" / "testdata"
+
+
+@dataclass
+class HTTPResponse:
+    body: bytes
+    headers: Dict[bytes, bytes]
+    status: int
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class CountingApp:
+    """
+    ASGI-приложение, которое считает дошедшие до него запросы.
+    Пока gate не установлен, запросы ждут, что позволяет проверить, что делает кеш,
+    пока ответ вычисляется.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.calls: List[str] = []
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.calls.append(scope["path"])
+        await self.gate.wait()
+        await self.app(scope, receive, send)
+
+
+@pytest.fixture
+def films() -> List[Dict]:
+    with (TESTDATA_DIR / "movies.json").open() as fixture_file:
+        return json.load(fixture_file)
+
+
+@pytest.fixture
+def upstream(monkeypatch, films) -> CountingApp:
+    """Приложение api с документами в памяти вместо elastic"""
+    monkeypatch.setattr(config, "DB_STORAGE", config.DB_STORAGE_MEMORY)
+    memory.create_storages({"movies": films})
+    return CountingApp(app)
+
+
+@pytest.fixture
+def cache_storage() -> LRUCacheStorage:
+    return LRUCacheStorage(max_size=64 * 1024 * 1024, expire=60 * 60)
+
+
+@pytest.fixture
+def cached_app(upstream: CountingApp, cache_storage: LRUCacheStorage) -> CacheMiddleware:
+    return CacheMiddleware(
+        upstream, cache_storage=cache_storage, routes=app.routes, path_tags=CACHE_PATH_TAGS
+    )
+
+
+@pytest.fixture
+def make_get_request():
+    async def inner(asgi_app: ASGIApp, url: str, headers: Dict[str, str] = None) -> HTTPResponse:
+        path, _, query = url.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": query.encode(),
+            "headers": [
+                (name.lower().encode(), value.encode()) for name, value in (headers or {}).items()
+            ],
+            "client": ("127.0.0.1", 0),
+            "server": ("testserver", 80),
+        }
+        response = HTTPResponse(body=b"", headers={}, status=0)
+
+        async def receive() -> Message:
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response.status = message["status"]
+                response.headers = dict(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response.body += message.get("body", b"")
+
+        await asgi_app(scope, receive, send)
+        return response
+
+    return inner
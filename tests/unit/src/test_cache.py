@@ -0,0 +1,185 @@
+import asyncio
+import gzip
+
+import pytest
+from main import CACHE_PATH_TAGS, app
+
+from core import config
+from core.middleware import CacheMiddleware
+from db.lru import LRUCacheStorage, TieredCacheStorage
+from db.redis import get_index_tag
+
+FILM_ID = "b05e03d9-3e7e-4233-ba9b-f81e417fc4b3"
+FILM_URL = f"/api/v1/film/{FILM_ID}/"
+FILM_LIST_URL = "/api/v1/film/"
+UNKNOWN_FILM_URL = "/api/v1/film/12345678-1234-4234-8234-123456789012/"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_call_upstream_once(make_get_request, upstream, cached_app):
+    """Одновременные промахи по одному ключу вычисляют ответ один раз"""
+    upstream.gate.clear()
+    requests = [asyncio.create_task(make_get_request(cached_app, FILM_URL)) for _ in range(20)]
+    # Все запросы успевают промахнуться, пока первый ждет ответа приложения
+    await asyncio.sleep(0.1)
+    upstream.gate.set()
+    responses = await asyncio.gather(*requests)
+
+    assert upstream.calls == [FILM_URL]
+    assert {response.status for response in responses} == {200}
+    assert len({response.body for response in responses}) == 1
+    assert responses[0].json()["id"] == FILM_ID
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_not_cached_response(make_get_request, upstream):
+    """
+    Воркер, который ждал блокировку другого воркера, не ждет ее истечения,
+    если ответ не попал в кеш (404 не кешируется), а сразу вычисляет его сам
+    """
+    remote = LRUCacheStorage(max_size=64 * 1024 * 1024, expire=60 * 60)
+    apps = [
+        CacheMiddleware(
+            upstream,
+            cache_storage=TieredCacheStorage(
+                local=LRUCacheStorage(max_size=64 * 1024 * 1024, expire=60 * 60), remote=remote
+            ),
+            routes=app.routes,
+            path_tags=CACHE_PATH_TAGS,
+        )
+        for _ in range(2)
+    ]
+    upstream.gate.clear()
+    requests = [
+        asyncio.create_task(make_get_request(worker_app, UNKNOWN_FILM_URL)) for worker_app in apps
+    ]
+    await asyncio.sleep(0.1)
+    upstream.gate.set()
+    responses = await asyncio.wait_for(asyncio.gather(*requests), timeout=1)
+
+    assert [response.status for response in responses] == [404, 404]
+    assert upstream.calls == [UNKNOWN_FILM_URL, UNKNOWN_FILM_URL]
+
+
+@pytest.mark.asyncio
+async def test_stale_response_served_while_revalidating(
+    monkeypatch, make_get_request, upstream, cached_app, films
+):
+    """Устаревший ответ отдается сразу, а обновляется в фоне одним запросом к приложению"""
+    # Ответ устаревает сразу после сохранения
+    monkeypatch.setattr(config, "CACHE_EXPIRE_IN_SECONDS", 0)
+    response = await make_get_request(cached_app, FILM_URL)
+    assert response.json()["title"] == "Star Wars: Knights of the Old Republic"
+
+    film = next(film for film in films if film["id"] == FILM_ID)
+    film["title"] = "Star Wars: Knights of the Old Republic II"
+    monkeypatch.setattr(config, "CACHE_EXPIRE_IN_SECONDS", 60)
+    upstream.gate.clear()
+
+    # Приложение не отвечает, пока идет обновление, но клиенты получают устаревший ответ
+    for _ in range(3):
+        response = await asyncio.wait_for(make_get_request(cached_app, FILM_URL), timeout=1)
+        assert response.status == 200
+        assert response.json()["title"] == "Star Wars: Knights of the Old Republic"
+    assert upstream.calls == [FILM_URL, FILM_URL]
+
+    upstream.gate.set()
+    await asyncio.gather(*cached_app.background_tasks)
+
+    response = await make_get_request(cached_app, FILM_URL)
+    assert response.json()["title"] == "Star Wars: Knights of the Old Republic II"
+    assert upstream.calls == [FILM_URL, FILM_URL]
+
+
+@pytest.mark.asyncio
+async def test_invalidation_by_tag(make_get_request, upstream, cache_storage, cached_app):
+    """Сброс по id сбрасывает ответы с этой сущностью, сброс по индексу - списки"""
+    await make_get_request(cached_app, FILM_URL)
+    await make_get_request(cached_app, FILM_LIST_URL)
+    assert upstream.calls == [FILM_URL, FILM_LIST_URL]
+
+    await cache_storage.invalidate([FILM_ID])
+    await make_get_request(cached_app, FILM_URL)
+    await make_get_request(cached_app, FILM_LIST_URL)
+    assert upstream.calls == [FILM_URL, FILM_LIST_URL, FILM_URL]
+
+    await cache_storage.invalidate([get_index_tag("movies")])
+    await make_get_request(cached_app, FILM_URL)
+    await make_get_request(cached_app, FILM_LIST_URL)
+    assert upstream.calls == [FILM_URL, FILM_LIST_URL, FILM_URL, FILM_LIST_URL]
+
+
+@pytest.mark.asyncio
+async def test_invalidation_by_tag_in_promoted_local_cache(make_get_request, upstream):
+    """
+    Ответ, поднятый из общего кеша в локальный кеш другого воркера, сбрасывается по тегу
+    и в нем, даже если общий индекс тегов уже удалил первый воркер
+    """
+    remote = LRUCacheStorage(max_size=64 * 1024 * 1024, expire=60 * 60)
+    workers = [
+        TieredCacheStorage(
+            local=LRUCacheStorage(max_size=64 * 1024 * 1024, expire=60 * 60), remote=remote
+        )
+        for _ in range(2)
+    ]
+    apps = [
+        CacheMiddleware(
+            upstream, cache_storage=worker, routes=app.routes, path_tags=CACHE_PATH_TAGS
+        )
+        for worker in workers
+    ]
+    for worker_app in apps:
+        await make_get_request(worker_app, FILM_URL)
+    assert upstream.calls == [FILM_URL]
+
+    for worker in workers:
+        await worker.invalidate([FILM_ID])
+    # Второй воркер получил ответ из общего кеша, но не отдает его из локального после сброса
+    await make_get_request(apps[1], FILM_URL)
+    assert upstream.calls == [FILM_URL, FILM_URL]
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, compressed",
+    [
+        (None, False),
+        ("gzip", True),
+        ("deflate, gzip;q=0.5", True),
+        ("*", True),
+        ("gzip;q=0", False),
+        ("br", False),
+    ],
+)
+@pytest.mark.asyncio
+async def test_compressed_response_negotiation(
+    monkeypatch, make_get_request, upstream, cached_app, accept_encoding, compressed
+):
+    """Сжатый в кеше ответ отдается как есть клиентам с gzip и распаковывается для остальных"""
+    monkeypatch.setattr(config, "CACHE_COMPRESS_MIN_SIZE", 0)
+    plain = await make_get_request(cached_app, FILM_LIST_URL)
+
+    headers = {"Accept-Encoding": accept_encoding} if accept_encoding else {}
+    response = await make_get_request(cached_app, FILM_LIST_URL, headers=headers)
+
+    assert upstream.calls == [FILM_LIST_URL]
+    assert response.status == 200
+    assert response.headers[b"vary"] == b"Accept-Encoding"
+    assert response.headers[b"content-length"] == b"%d" % len(response.body)
+    if compressed:
+        assert response.headers[b"content-encoding"] == b"gzip"
+        assert gzip.decompress(response.body) == plain.body
+    else:
+        assert b"content-encoding" not in response.headers
+        assert response.body == plain.body
+
+
+@pytest.mark.asyncio
+async def test_small_response_not_compressed(monkeypatch, make_get_request, cached_app):
+    monkeypatch.setattr(config, "CACHE_COMPRESS_MIN_SIZE", 1024 * 1024)
+    await make_get_request(cached_app, FILM_LIST_URL)
+    response = await make_get_request(
+        cached_app, FILM_LIST_URL, headers={"Accept-Encoding": "gzip"}
+    )
+
+    assert b"content-encoding" not in response.headers
+    assert response.json()
@@ -0,0 +1,92 @@
+from enum import Enum
+from typing import List, Optional
+from uuid import UUID
+
+import pytest
+from fastapi import Depends, FastAPI, Query
+from starlette.routing import Route
+
+from core.route_params import get_canonical_query
+
+
+class Sort(str, Enum):
+    title = "title"
+    rating = "-imdb_rating"
+
+
+async def pagination(
+    page_number: int = Query(default=1, ge=1, alias="page[number]"),
+    page_size: int = Query(default=50, ge=1, alias="page[size]"),
+) -> None:
+    pass
+
+
+app = FastAPI()
+
+
+@app.get("/items/")
+async def item_list(
+    sort: Sort = Query(default=Sort.title),
+    # С ограничением pydantic 1 хранит тип параметра как подкласс list без параметров типа
+    ids: Optional[List[UUID]] = Query(default=None, max_items=10),
+    archived: bool = False,
+    pagination: None = Depends(pagination),
+) -> None:
+    pass
+
+
+@app.get("/search/")
+async def item_search(query: str) -> None:
+    pass
+
+
+def get_route(path: str):
+    return next(route for route in app.routes if getattr(route, "path", None) == path)
+
+
+@pytest.mark.parametrize(
+    "query_string",
+    [
+        b"",
+        b"sort=title",
+        b"page[size]=50&sort=title&page[number]=1",
+        b"archived=false&unknown=1",
+        b"archived=0&page%5Bnumber%5D=1",
+    ],
+)
+def test_equivalent_queries_are_canonical(query_string: bytes):
+    """Параметры отсортированы, значения по умолчанию подставлены, неизвестные отброшены"""
+    assert get_canonical_query(get_route("/items/"), query_string) == (
+        "archived=false&page%5Bnumber%5D=1&page%5Bsize%5D=50&sort=title"
+    )
+
+
+def test_sequence_query_param():
+    ids = ["b05e03d9-3e7e-4233-ba9b-f81e417fc4b3", "0550ff1f-4367-4b73-a29a-be69eb46070e"]
+    query_string = f"ids={ids[0]}&ids={ids[1]}&sort=-imdb_rating".encode()
+
+    assert get_canonical_query(get_route("/items/"), query_string) == (
+        f"archived=false&ids={ids[0]}&ids={ids[1]}"
+        "&page%5Bnumber%5D=1&page%5Bsize%5D=50&sort=-imdb_rating"
+    )
+
+
+@pytest.mark.parametrize(
+    "path, query_string",
+    [
+        ("/items/", b"page[number]=0"),
+        ("/items/", b"sort=unknown"),
+        ("/items/", b"ids=not-a-uuid"),
+        ("/search/", b""),
+    ],
+)
+def test_invalid_query_is_not_canonical(path: str, query_string: bytes):
+    """Запросы с невалидными или недостающими параметрами не кешируются"""
+    assert get_canonical_query(get_route(path), query_string) is None
+
+
+def test_not_fastapi_route():
+    async def endpoint(request):
+        pass
+
+    assert get_canonical_query(Route("/plain/", endpoint), b"") is None